@@ -1,9 +1,14 @@
 import streamlit as st
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 from matplotlib.patches import Rectangle
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.backends.backend_pdf import PdfPages
 from io import BytesIO
+from numba import njit
 
 # =====================================================
 # CONFIG
@@ -37,57 +42,136 @@ with st.form("form"):
     add = st.form_submit_button("Adicionar")
 
     if add:
-        for _ in range(q):
-            st.session_state.pecas.append((nome, w, h))
+        st.session_state.pecas.extend([(nome, w, h)] * int(q))
+
+@st.cache_data(show_spinner=False)
+def pecas_df(pecas_tuple):
+    return pd.DataFrame(pecas_tuple, columns=["Nome", "Comprimento", "Largura"])
+
 
 if st.session_state.pecas:
-    st.table(st.session_state.pecas)
+    st.dataframe(pecas_df(tuple(st.session_state.pecas)), hide_index=True)
 
 # =====================================================
 # MOTOR DE FAIXAS (CORTE CERTO REAL)
 # =====================================================
-def gerar_chapas(pecas):
+@njit(cache=True)
+def _posicionar_pecas(W, H, CH_L, CH_A, KERF):
+    # Best-Fit Decreasing Height: cada peça (já em ordem decrescente de
+    # altura) vai para a faixa aberta, de qualquer chapa, que sobrar menos
+    # largura. Devolve chapa, x e y de cada peça e o total de chapas.
+    n = W.size
+    pos_chapa = np.empty(n, np.int32)
+    pos_x = np.empty(n, np.int32)
+    pos_y = np.empty(n, np.int32)
+
+    # Faixas abertas: chapa, y, altura e x já ocupado
+    faixa_chapa = np.empty(n, np.int32)
+    faixa_y = np.empty(n, np.int32)
+    faixa_h = np.empty(n, np.int32)
+    faixa_x = np.empty(n, np.int32)
+    n_faixas = 0
+
+    topo = np.empty(n, np.int32)
+    n_chapas = 0
+
+    # Menor largura entre as peças ainda não colocadas (mínimo dos sufixos)
+    min_w = np.zeros(n + 1, np.int32)
+    for k in range(n - 1, -1, -1):
+        min_w[k] = W[k] if k == n - 1 else min(W[k], min_w[k + 1])
+
+    for k in range(n):
+        w = W[k]
+        h = H[k]
+
+        j = -1
+        melhor = CH_L + 1
+        for f in range(n_faixas):
+            folga = CH_L - faixa_x[f] - w
+            if faixa_h[f] >= h and 0 <= folga < melhor:
+                melhor = folga
+                j = f
+
+        if j < 0:
+            # Nova faixa na primeira chapa com altura livre, senão chapa nova
+            c = -1
+            for t in range(n_chapas):
+                if topo[t] + h <= CH_A:
+                    c = t
+                    break
+            if c < 0:
+                c = n_chapas
+                topo[c] = 0
+                n_chapas += 1
+
+            j = n_faixas
+            n_faixas += 1
+            faixa_chapa[j] = c
+            faixa_y[j] = topo[c]
+            faixa_h[j] = h
+            faixa_x[j] = 0
+            topo[c] += h + KERF
+
+        pos_chapa[k] = faixa_chapa[j]
+        pos_x[k] = faixa_x[j]
+        pos_y[k] = faixa_y[j]
+        faixa_x[j] += w + KERF
+
+        # Fecha as faixas onde nem a peça mais estreita restante cabe mais,
+        # para não varrê-las de novo (a ordem das abertas é mantida)
+        if min_w[k + 1] > min_w[k] or CH_L - faixa_x[j] < min_w[k + 1]:
+            m = 0
+            for f in range(n_faixas):
+                if CH_L - faixa_x[f] >= min_w[k + 1]:
+                    faixa_chapa[m] = faixa_chapa[f]
+                    faixa_y[m] = faixa_y[f]
+                    faixa_h[m] = faixa_h[f]
+                    faixa_x[m] = faixa_x[f]
+                    m += 1
+            n_faixas = m
+
+    return pos_chapa, pos_x, pos_y, n_chapas
+
+
+def gerar_chapas(pecas, CH_L, CH_A, KERF):
+    W = np.asarray([p[1] for p in pecas], dtype=np.int32)
+    H = np.asarray([p[2] for p in pecas], dtype=np.int32)
+    ordem = np.argsort(-H, kind="stable")
+    W, H = W[ordem], H[ordem]
+    nomes = [pecas[i][0] for i in ordem.tolist()]
+
+    pos_chapa, pos_x, pos_y, n_chapas = _posicionar_pecas(W, H, CH_L, CH_A, KERF)
+
+    # Cada chapa sai como SoA: arrays x, y, w, h e a lista de nomes,
+    # na ordem em que as peças foram colocadas
+    por_chapa = np.argsort(pos_chapa, kind="stable")
+    fins = np.cumsum(np.bincount(pos_chapa, minlength=n_chapas)).tolist()
     chapas = []
-    restantes = pecas[:]
-
-    while restantes:
-        chapa = []
-        y = 0
-
-        restantes.sort(key=lambda p: p[2], reverse=True)
-
-        while restantes and y < CH_A:
-            altura_faixa = restantes[0][2]
-            x = 0
-            usados = []
-
-            for nome, w, h in restantes:
-                if h <= altura_faixa and x + w <= CH_L:
-                    chapa.append({
-                        "x": x,
-                        "y": y,
-                        "w": w,
-                        "h": h,
-                        "nome": nome
-                    })
-                    x += w + KERF
-                    usados.append((nome, w, h))
-
-            for u in usados:
-                restantes.remove(u)
-
-            y += altura_faixa + KERF
-
-        chapas.append(chapa)
+    inicio = 0
+    for fim in fins:
+        sel = por_chapa[inicio:fim]
+        chapas.append({
+            "x": pos_x[sel],
+            "y": pos_y[sel],
+            "w": W[sel],
+            "h": H[sel],
+            "nome": [nomes[i] for i in sel.tolist()]
+        })
+        inicio = fim
 
     return chapas
 
+@st.cache_data(show_spinner=False)
+def gerar_chapas_cached(pecas_tuple, CH_L, CH_A, KERF):
+    return gerar_chapas(list(pecas_tuple), CH_L, CH_A, KERF)
+
 # =====================================================
 # DESENHO — IGUAL CORTE CERTO
 # =====================================================
-def desenhar_chapa(chapa, idx):
-    fig, ax = plt.subplots(figsize=(15, 7))
+def desenhar_chapa(chapa, idx, CH_L, CH_A, KERF, ESPESSURA, dpi=72):
+    fig, ax = plt.subplots(figsize=(15, 7), dpi=dpi)
     margem = 80
+    xs, ys, ws, hs = chapa["x"], chapa["y"], chapa["w"], chapa["h"]
 
     # CHAPA
     ax.add_patch(Rectangle(
@@ -99,30 +183,47 @@ def desenhar_chapa(chapa, idx):
     ))
 
     # FAIXAS
-    faixas_y = sorted(set([p["y"] for p in chapa]))
-    for y in faixas_y:
-        ax.plot(
-            [margem, margem + CH_L],
-            [y + margem, y + margem],
-            linestyle="--",
-            color="black",
-            linewidth=0.8
-        )
+    faixas_y = np.unique(ys).tolist()
+    ax.add_collection(LineCollection(
+        [[(margem, y + margem), (margem + CH_L, y + margem)] for y in faixas_y],
+        linestyle="--",
+        color="black",
+        linewidth=0.8
+    ))
+
+    # PEÇAS: vértices (N, 4, 2) montados direto dos arrays, sem um
+    # Rectangle por peça
+    x0, y0 = xs + margem, ys + margem
+    x1, y1 = x0 + ws, y0 + hs
+    cantos = np.empty((xs.size, 4, 2), dtype=np.float32)
+    cantos[:, 0, 0], cantos[:, 0, 1] = x0, y0
+    cantos[:, 1, 0], cantos[:, 1, 1] = x1, y0
+    cantos[:, 2, 0], cantos[:, 2, 1] = x1, y1
+    cantos[:, 3, 0], cantos[:, 3, 1] = x0, y1
+    ax.add_collection(PolyCollection(
+        cantos,
+        facecolors="#F28C28",
+        edgecolors="black",
+        linewidths=1
+    ))
+
+    # Rótulos: pula peças pequenas demais para ler (< 30 px na tela) e
+    # reaproveita o texto das peças repetidas
+    px_por_mm = min(15 / (CH_L + margem * 2), 7 / (CH_A + margem * 2)) * fig.get_dpi()
+    min_mm = 30 / px_por_mm
+    rotulos = {}
 
-    # PEÇAS
-    for p in chapa:
-        ax.add_patch(Rectangle(
-            (p["x"] + margem, p["y"] + margem),
-            p["w"], p["h"],
-            facecolor="#F28C28",
-            edgecolor="black",
-            linewidth=1
-        ))
+    for i in np.flatnonzero(np.minimum(ws, hs) >= min_mm).tolist():
+        nome, x, y, w, h = chapa["nome"][i], int(xs[i]), int(ys[i]), int(ws[i]), int(hs[i])
+
+        chave = (nome, w, h)
+        if chave not in rotulos:
+            rotulos[chave] = f'{nome}\n{w} × {h} mm'
 
         ax.text(
-            p["x"] + margem + p["w"] / 2,
-            p["y"] + margem + p["h"] / 2,
-            f'{p["nome"]}\n{p["w"]} × {p["h"]} mm',
+            x + margem + w / 2,
+            y + margem + h / 2,
+            rotulos[chave],
             ha="center",
             va="center",
             fontsize=8,
@@ -130,15 +231,13 @@ def desenhar_chapa(chapa, idx):
         )
 
     # CORTES VERTICAIS
-    cortes_x = sorted(set([p["x"] + p["w"] for p in chapa]))
-    for x in cortes_x:
-        ax.plot(
-            [x + margem, x + margem],
-            [margem, margem + CH_A],
-            linestyle="--",
-            color="black",
-            linewidth=0.8
-        )
+    cortes_x = np.unique(xs + ws).tolist()
+    ax.add_collection(LineCollection(
+        [[(x + margem, margem), (x + margem, margem + CH_A)] for x in cortes_x],
+        linestyle="--",
+        color="black",
+        linewidth=0.8
+    ))
 
     # CABEÇALHO
     ax.text(
@@ -164,45 +263,61 @@ def desenhar_chapa(chapa, idx):
 
     return fig
 
+
+@st.cache_data(show_spinner=False)
+def render_chapa_png(chapa, CH_L, CH_A, KERF, ESPESSURA, idx):
+    """PNG da chapa; as medidas vão para o desenho e, com as peças, para a chave do cache."""
+    fig = desenhar_chapa(chapa, idx, CH_L, CH_A, KERF, ESPESSURA)
+    buf = BytesIO()
+    fig.savefig(buf, format="png", dpi=fig.dpi, bbox_inches="tight")
+    plt.close(fig)
+    return buf.getvalue()
+
 # =====================================================
 # PDF
 # =====================================================
-def gerar_pdf(chapas):
+def gerar_pdf(chapas, CH_L, CH_A, KERF, ESPESSURA):
+    # Vetorial: as peças viram objetos PDF nativos, sem passar por PNG
     buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-
-    for i, chapa in enumerate(chapas):
-        fig = desenhar_chapa(chapa, i)
-        img = BytesIO()
-        fig.savefig(img, format="png", dpi=200, bbox_inches="tight")
-        plt.close(fig)
-        img.seek(0)
 
-        c.drawImage(img, 30, 90, width=530, preserveAspectRatio=True)
-        c.drawString(30, 820, f"Plano de Corte — Chapa {i+1}")
-        c.showPage()
+    with PdfPages(buffer) as pdf:
+        for i, chapa in enumerate(chapas):
+            fig = desenhar_chapa(chapa, i, CH_L, CH_A, KERF, ESPESSURA, dpi=200)
+            fig.suptitle(f"Plano de Corte — Chapa {i+1}", x=0.02, ha="left")
+            pdf.savefig(fig, bbox_inches="tight")
+            plt.close(fig)
 
-    c.save()
     buffer.seek(0)
     return buffer
 
 # =====================================================
 # EXECUTAR
 # =====================================================
+@st.fragment
+def render_planos(pecas_tuple, CH_L, CH_A, KERF, ESPESSURA):
+    # Fragmento: o download do PDF reexecuta só este trecho, não a página
+    chapas = gerar_chapas_cached(pecas_tuple, CH_L, CH_A, KERF)
+    st.success(f"📦 Chapas necessárias: {len(chapas)}")
+
+    for i, chapa in enumerate(chapas):
+        # PNG já pronto: sem reconversão no servidor, só esticado no navegador
+        st.image(
+            render_chapa_png(chapa, CH_L, CH_A, KERF, ESPESSURA, i),
+            output_format="PNG",
+            use_container_width=True
+        )
+
+    pdf = gerar_pdf(chapas, CH_L, CH_A, KERF, ESPESSURA)
+    st.download_button(
+        "⬇️ Baixar PDF",
+        pdf,
+        "plano_corte_mdf.pdf",
+        "application/pdf"
+    )
+
+
 if st.button("🚀 Gerar Plano de Corte"):
     if not st.session_state.pecas:
         st.warning("Cadastre as peças.")
     else:
-        chapas = gerar_chapas(st.session_state.pecas)
-        st.success(f"📦 Chapas necessárias: {len(chapas)}")
-
-        for i, chapa in enumerate(chapas):
-            st.pyplot(desenhar_chapa(chapa, i), use_container_width=True)
-
-        pdf = gerar_pdf(chapas)
-        st.download_button(
-            "⬇️ Baixar PDF",
-            pdf,
-            "plano_corte_mdf.pdf",
-            "application/pdf"
-        )
+        render_planos(tuple(st.session_state.pecas), CH_L, CH_A, KERF, ESPESSURA)
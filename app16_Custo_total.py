@@ -15,11 +15,17 @@ sys.path.insert(0, os.path.dirname(__file__))
 # Importar database
 from database import db_manager, Cliente, TipoChapa, TipoFita, Projeto, PecaProjeto
 
-# Importar módulos do sistema antigo
+# Importar módulos do sistema antigo (uma vez por processo, não a cada rerun)
 import importlib.util
-spec = importlib.util.spec_from_file_location("corte_certo_engine", "corte_certo.py")
-engine = importlib.util.module_from_spec(spec)
-spec.loader.exec_module(engine)
+
+@st.cache_resource
+def load_engine():
+    spec = importlib.util.spec_from_file_location("corte_certo_engine", "corte_certo.py")
+    m = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(m)
+    return m
+
+engine = load_engine()
 
 # ============================================================================
 # CONFIGURAÇÃO DA PÁGINA
@@ -6,17 +6,16 @@ Versão: 1.0
 """
 
 import streamlit as st
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from reportlab.lib.utils import ImageReader
 from io import BytesIO
-from PIL import Image
+import numpy as np
 import pandas as pd
-from dataclasses import dataclass
-from typing import List, Tuple
-import copy
+from collections import defaultdict
+from dataclasses import astuple, dataclass, field
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
 
 # ============================================================================
 # CLASSES DE DADOS
@@ -59,6 +58,21 @@ class Peca:
             self.fita_borda_larg1,
             self.fita_borda_larg2
         ])
+    
+    @staticmethod
+    @lru_cache(maxsize=None)  # entradas são só as combinações das 4 bordas
+    def bordas_str(comp1, comp2, larg1, larg2) -> str:
+        """Setas das bordas com fita (ex.: "▲ ◀"), ou "-" se não houver"""
+        bordas = []
+        if comp1:
+            bordas.append("▲")
+        if comp2:
+            bordas.append("▼")
+        if larg1:
+            bordas.append("◀")
+        if larg2:
+            bordas.append("▶")
+        return " ".join(bordas) if bordas else "-"
 
 
 @dataclass
@@ -68,14 +82,16 @@ class PecaPosicionada:
     x: float
     y: float
     rotacionada: bool = False
+    # Medidas já com a rotação aplicada; fixas desde a criação, viram campos
+    # comuns em vez de properties recalculadas a cada acesso nos desenhos
+    comprimento_final: float = field(init=False, repr=False, compare=False)
+    largura_final: float = field(init=False, repr=False, compare=False)
     
-    @property
-    def comprimento_final(self) -> float:
-        return self.peca.largura if self.rotacionada else self.peca.comprimento
-    
-    @property
-    def largura_final(self) -> float:
-        return self.peca.comprimento if self.rotacionada else self.peca.largura
+    def __post_init__(self):
+        if self.rotacionada:
+            self.comprimento_final, self.largura_final = self.peca.largura, self.peca.comprimento
+        else:
+            self.comprimento_final, self.largura_final = self.peca.comprimento, self.peca.largura
 
 
 @dataclass
@@ -103,20 +119,35 @@ class Chapa:
     espessura: float
     kerf: float
     faixas: List[Faixa]
+    # Área das peças (mm²): o otimizador já passa a soma feita ao alocá-las;
+    # senão é calculada na primeira chamada (as faixas não mudam depois que
+    # a chapa é fechada)
+    area_usada: Optional[float] = field(default=None, repr=False, compare=False)
     
     def calcular_utilizacao(self) -> float:
         """Calcula percentual de aproveitamento da chapa"""
+        if self.area_usada is None:
+            self.area_usada = sum(
+                p.peca.comprimento * p.peca.largura
+                for faixa in self.faixas
+                for p in faixa.pecas
+            )
         area_total = self.comprimento * self.largura
-        area_usada = sum(
-            p.peca.comprimento * p.peca.largura
-            for faixa in self.faixas
-            for p in faixa.pecas
-        )
-        return (area_usada / area_total) * 100 if area_total > 0 else 0
+        return (self.area_usada / area_total) * 100 if area_total > 0 else 0
     
     def calcular_desperdicio(self) -> float:
         """Calcula percentual de desperdício"""
         return 100 - self.calcular_utilizacao()
+    
+    def assinatura(self) -> tuple:
+        """Layout completo da chapa como tupla hashable (chave dos diagramas em cache)"""
+        return (
+            self.numero, self.comprimento, self.largura, self.espessura, self.kerf,
+            tuple(
+                (f.y_inicio, f.altura, tuple((p.x, p.y, p.rotacionada, astuple(p.peca)) for p in f.pecas))
+                for f in self.faixas
+            )
+        )
 
 
 # ============================================================================
@@ -140,11 +171,11 @@ class OtimizadorCortes:
         Algoritmo principal de otimização melhorado
         Estratégia: Guilhotina com suporte a rotação e veio
         """
-        # Expandir peças pela quantidade
+        # Expandir peças pela quantidade; nada no empacotamento altera a Peca,
+        # então as cópias de uma mesma peça apontam para o mesmo objeto
         pecas_expandidas = []
         for peca in pecas:
-            for i in range(peca.quantidade):
-                pecas_expandidas.append(copy.deepcopy(peca))
+            pecas_expandidas.extend([peca] * peca.quantidade)
         
         # Ordenar peças por área (maior primeiro) para melhor aproveitamento
         pecas_ordenadas = sorted(
@@ -167,112 +198,123 @@ class OtimizadorCortes:
         faixas = []
         y_atual = 0
         
-        while y_atual < self.largura_chapa and pecas_disponiveis:
+        # Peças usadas só são marcadas; a lista é compactada uma vez no fim
+        # da chapa, em vez de um pop(i) (O(n)) por peça alocada
+        disponivel = [True] * len(pecas_disponiveis)
+        restantes = len(pecas_disponiveis)
+        area_usada = 0
+        
+        # Índices das peças por medida (mm inteiros) com que podem definir a
+        # altura de uma faixa, em ordem crescente
+        por_medida = defaultdict(list)
+        for i, peca in enumerate(pecas_disponiveis):
+            por_medida[int(peca.largura)].append(i)
+            if not peca.respeitar_veio and int(peca.comprimento) != int(peca.largura):
+                por_medida[int(peca.comprimento)].append(i)
+        
+        while y_atual < self.largura_chapa and restantes:
             # Criar faixa otimizada (já tenta rotação internamente)
-            faixa = self._criar_faixa_otimizada(y_atual, pecas_disponiveis)
+            faixa, area_faixa = self._criar_faixa_otimizada(y_atual, pecas_disponiveis, disponivel, por_medida)
             
             if not faixa.pecas:
                 # Realmente não cabe mais nada
                 break
             
             faixas.append(faixa)
+            restantes -= len(faixa.pecas)
+            area_usada += area_faixa
             y_atual += faixa.altura + self.kerf
         
+        pecas_disponiveis[:] = [p for p, livre in zip(pecas_disponiveis, disponivel) if livre]
+        
         return Chapa(
             numero=numero,
             comprimento=self.comprimento_chapa,
             largura=self.largura_chapa,
             espessura=self.espessura,
             kerf=self.kerf,
-            faixas=faixas
+            faixas=faixas,
+            area_usada=area_usada
         )
     
-    def _criar_faixa_otimizada(self, y_inicio: float, pecas_disponiveis: List[Peca]) -> Faixa:
-        """Cria uma faixa tentando maximizar o aproveitamento com rotação inteligente"""
+    def _criar_faixa_otimizada(self, y_inicio: float, pecas_disponiveis: List[Peca],
+                               disponivel: List[bool],
+                               por_medida: Dict[int, List[int]]) -> Tuple[Faixa, float]:
+        """Cria uma faixa tentando maximizar o aproveitamento com rotação inteligente
+        
+        Peças alocadas são marcadas como False em `disponivel`; `por_medida` dá
+        os índices das peças por medida em mm inteiros (largura e, se a peça
+        pode girar, comprimento). Retorna a faixa e a área somada das suas peças.
+        """
         altura_faixa = 0
         pecas_faixa = []
         x_atual = 0
-        
-        # Primeira passagem: encontrar peças que cabem (escolhendo melhor orientação)
-        i = 0
-        while i < len(pecas_disponiveis):
-            peca = pecas_disponiveis[i]
-            
-            opcoes = []
+        area_usada = 0
+        
+        # Primeira passagem: a primeira peça que couber define a altura da faixa...
+        for primeira, peca in enumerate(pecas_disponiveis):
+            if not disponivel[primeira]:
+                continue
+            # Descarte rápido: a peça não cabe na altura que sobra em nenhuma orientação
+            if (y_inicio + peca.largura > self.largura_chapa and
+                    (peca.respeitar_veio or y_inicio + peca.comprimento > self.largura_chapa)):
+                continue
             
-            # Opção 1: Orientação normal
-            if y_inicio + peca.largura <= self.largura_chapa:
-                if altura_faixa == 0 or abs(peca.largura - altura_faixa) <= 5:
-                    espaco_necessario = peca.comprimento
-                    if pecas_faixa:
-                        espaco_necessario += self.kerf
-                    
-                    if x_atual + espaco_necessario <= self.comprimento_chapa:
-                        opcoes.append({
-                            'rotacionada': False,
-                            'largura': peca.largura,
-                            'comprimento': peca.comprimento,
-                            'fit_score': self._calcular_fit_score(
-                                peca.largura, peca.comprimento, altura_faixa, 
-                                self.comprimento_chapa - x_atual
-                            )
-                        })
-            
-            # Opção 2: Orientação rotacionada (só se permitido)
-            if not peca.respeitar_veio:
-                comp_rot = peca.largura
-                larg_rot = peca.comprimento
-                
-                if y_inicio + larg_rot <= self.largura_chapa:
-                    if altura_faixa == 0 or abs(larg_rot - altura_faixa) <= 5:
-                        espaco_necessario = comp_rot
-                        if pecas_faixa:
-                            espaco_necessario += self.kerf
-                        
-                        if x_atual + espaco_necessario <= self.comprimento_chapa:
-                            opcoes.append({
-                                'rotacionada': True,
-                                'largura': larg_rot,
-                                'comprimento': comp_rot,
-                                'fit_score': self._calcular_fit_score(
-                                    larg_rot, comp_rot, altura_faixa,
-                                    self.comprimento_chapa - x_atual
-                                )
-                            })
-            
-            # Escolher melhor opção (maior fit_score)
-            if opcoes:
-                melhor_opcao = max(opcoes, key=lambda x: x['fit_score'])
+            melhor_opcao = self._melhor_opcao_faixa(peca, y_inicio, 0, 0, False)
+            if melhor_opcao:
+                altura_faixa = melhor_opcao['largura']
+                pecas_faixa.append(PecaPosicionada(
+                    peca=peca,
+                    x=x_atual,
+                    y=y_inicio,
+                    rotacionada=melhor_opcao['rotacionada']
+                ))
+                x_atual += melhor_opcao['comprimento'] + self.kerf
+                area_usada += peca.comprimento * peca.largura
+                disponivel[primeira] = False
+                break
+        
+        # ...e daí em diante só entram peças com alguma medida a até 5 mm dela.
+        # Em vez de varrer a lista toda, elas vêm do índice por mm inteiro,
+        # na mesma ordem da lista (maior área primeiro)
+        if pecas_faixa:
+            h = int(altura_faixa)
+            candidatos = sorted({
+                i for medida in range(h - 5, h + 6)
+                for i in por_medida.get(medida, ())
+                if i > primeira
+            })
+            for i in candidatos:
+                if not disponivel[i]:
+                    continue
                 
-                # Definir altura da faixa se for a primeira peça
-                if altura_faixa == 0:
-                    altura_faixa = melhor_opcao['largura']
+                peca = pecas_disponiveis[i]
+                melhor_opcao = self._melhor_opcao_faixa(peca, y_inicio, altura_faixa, x_atual, True)
                 
                 # Verificar compatibilidade final com a faixa
-                if abs(melhor_opcao['largura'] - altura_faixa) <= 5:
+                if melhor_opcao and abs(melhor_opcao['largura'] - altura_faixa) <= 5:
                     # Alocar peça
-                    peca_posicionada = PecaPosicionada(
+                    pecas_faixa.append(PecaPosicionada(
                         peca=peca,
                         x=x_atual,
                         y=y_inicio,
                         rotacionada=melhor_opcao['rotacionada']
-                    )
-                    pecas_faixa.append(peca_posicionada)
+                    ))
                     x_atual += melhor_opcao['comprimento'] + self.kerf
+                    area_usada += peca.comprimento * peca.largura
                     
-                    # Remover peça da lista
-                    pecas_disponiveis.pop(i)
-                    continue
-            
-            i += 1
+                    # Marcar peça como usada
+                    disponivel[i] = False
         
         # Segunda passagem: preencher espaços vazios com peças menores
         if x_atual < self.comprimento_chapa and altura_faixa > 0:
             espaco_restante = self.comprimento_chapa - x_atual - self.kerf
             
-            i = 0
-            while i < len(pecas_disponiveis) and espaco_restante > 50:  # Só tenta se tiver espaço razoável
-                peca = pecas_disponiveis[i]
+            for i, peca in enumerate(pecas_disponiveis):
+                if espaco_restante <= 50:  # Só tenta se tiver espaço razoável
+                    break
+                if not disponivel[i]:
+                    continue
                 
                 opcoes_preenchimento = []
                 
@@ -311,18 +353,66 @@ class OtimizadorCortes:
                     )
                     pecas_faixa.append(peca_posicionada)
                     x_atual += melhor['comprimento'] + self.kerf
+                    area_usada += peca.comprimento * peca.largura
                     espaco_restante = self.comprimento_chapa - x_atual - self.kerf
                     
-                    pecas_disponiveis.pop(i)
-                    continue
-                
-                i += 1
+                    disponivel[i] = False
         
         return Faixa(
             y_inicio=y_inicio,
             altura=altura_faixa,
             pecas=pecas_faixa
-        )
+        ), area_usada
+    
+    def _melhor_opcao_faixa(self, peca: Peca, y_inicio: float, altura_faixa: float,
+                            x_atual: float, faixa_com_pecas: bool) -> Optional[dict]:
+        """Melhor orientação (maior fit_score) da peça na faixa, ou None se não couber"""
+        opcoes = []
+        
+        # Opção 1: Orientação normal
+        if y_inicio + peca.largura <= self.largura_chapa:
+            if altura_faixa == 0 or abs(peca.largura - altura_faixa) <= 5:
+                espaco_necessario = peca.comprimento
+                if faixa_com_pecas:
+                    espaco_necessario += self.kerf
+                
+                if x_atual + espaco_necessario <= self.comprimento_chapa:
+                    opcoes.append({
+                        'rotacionada': False,
+                        'largura': peca.largura,
+                        'comprimento': peca.comprimento,
+                        'fit_score': self._calcular_fit_score(
+                            peca.largura, peca.comprimento, altura_faixa, 
+                            self.comprimento_chapa - x_atual
+                        )
+                    })
+        
+        # Opção 2: Orientação rotacionada (só se permitido)
+        if not peca.respeitar_veio:
+            comp_rot = peca.largura
+            larg_rot = peca.comprimento
+            
+            if y_inicio + larg_rot <= self.largura_chapa:
+                if altura_faixa == 0 or abs(larg_rot - altura_faixa) <= 5:
+                    espaco_necessario = comp_rot
+                    if faixa_com_pecas:
+                        espaco_necessario += self.kerf
+                    
+                    if x_atual + espaco_necessario <= self.comprimento_chapa:
+                        opcoes.append({
+                            'rotacionada': True,
+                            'largura': larg_rot,
+                            'comprimento': comp_rot,
+                            'fit_score': self._calcular_fit_score(
+                                larg_rot, comp_rot, altura_faixa,
+                                self.comprimento_chapa - x_atual
+                            )
+                        })
+        
+        # Escolher melhor opção (maior fit_score)
+        if not opcoes:
+            return None
+        return max(opcoes, key=lambda x: x['fit_score'])
     
     def _calcular_fit_score(self, largura: float, comprimento: float, 
                            altura_faixa: float, espaco_horizontal: float) -> float:
@@ -364,14 +454,24 @@ class GeradorDiagrama:
     def __init__(self, chapa: Chapa):
         self.chapa = chapa
     
-    def gerar_diagrama(self, dpi: int = 150) -> plt.Figure:
+    def gerar_diagrama(self, dpi: int = 150) -> "Figure":
         """Gera o diagrama técnico da chapa"""
+        # matplotlib só é carregado no primeiro diagrama, não na abertura do app.
+        # Figure com canvas Agg próprio: fora do registro global do pyplot, não
+        # precisa de plt.close e pode ser desenhada em outra thread
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        import matplotlib.patches as patches
+        from matplotlib.collections import LineCollection, PatchCollection
+        
         # Calcular tamanho da figura proporcional
         aspecto = self.chapa.comprimento / self.chapa.largura
         largura_fig = 12
         altura_fig = largura_fig / aspecto
         
-        fig, ax = plt.subplots(figsize=(largura_fig, altura_fig), dpi=dpi)
+        fig = Figure(figsize=(largura_fig, altura_fig), dpi=dpi)
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot(111)
         
         # Remover eixos e grid (visual técnico limpo)
         ax.set_xlim(0, self.chapa.comprimento)
@@ -391,92 +491,40 @@ class GeradorDiagrama:
         )
         ax.add_patch(chapa_rect)
         
+        # Peças, linhas tracejadas e fitas são acumuladas e desenhadas como
+        # três coleções, em vez de um patch/Line2D por elemento
+        retangulos = []
+        cortes = []
+        fitas = []
+        
         # Desenhar faixas e peças
         for faixa in self.chapa.faixas:
             # Linha tracejada da faixa (horizontal)
-            ax.plot(
-                [0, self.chapa.comprimento],
-                [faixa.y_inicio, faixa.y_inicio],
-                color=self.COR_LINHA_TRACEJADA,
-                linestyle='--',
-                linewidth=0.8,
-                alpha=0.6,
-                zorder=2
-            )
+            cortes.append([(0, faixa.y_inicio), (self.chapa.comprimento, faixa.y_inicio)])
             
             # Desenhar peças
             for peca_pos in faixa.pecas:
+                x0, y0 = peca_pos.x, peca_pos.y
+                x1 = x0 + peca_pos.comprimento_final
+                y1 = y0 + peca_pos.largura_final
+                
                 # Retângulo da peça (laranja)
-                rect = patches.Rectangle(
-                    (peca_pos.x, peca_pos.y),
-                    peca_pos.comprimento_final,
-                    peca_pos.largura_final,
-                    linewidth=1.5,
-                    edgecolor=self.COR_LINHA,
-                    facecolor=self.COR_PECA,
-                    zorder=3
-                )
-                ax.add_patch(rect)
+                retangulos.append(patches.Rectangle((x0, y0), x1 - x0, y1 - y0))
                 
-                # Desenhar indicadores de fita de borda (linhas grossas)
+                # Indicadores de fita de borda (linhas grossas)
                 if peca_pos.peca.tem_fita():
-                    espessura_fita = 4  # Espessura visual da linha de fita
-                    
-                    # Borda superior (comprimento 1)
-                    if peca_pos.peca.fita_borda_comp1:
-                        ax.plot(
-                            [peca_pos.x, peca_pos.x + peca_pos.comprimento_final],
-                            [peca_pos.y + peca_pos.largura_final, peca_pos.y + peca_pos.largura_final],
-                            color='#8B4513',  # Marrom (cor de fita de borda)
-                            linewidth=espessura_fita,
-                            solid_capstyle='butt',
-                            zorder=4
-                        )
-                    
-                    # Borda inferior (comprimento 2)
-                    if peca_pos.peca.fita_borda_comp2:
-                        ax.plot(
-                            [peca_pos.x, peca_pos.x + peca_pos.comprimento_final],
-                            [peca_pos.y, peca_pos.y],
-                            color='#8B4513',
-                            linewidth=espessura_fita,
-                            solid_capstyle='butt',
-                            zorder=4
-                        )
-                    
-                    # Borda esquerda (largura 1)
-                    if peca_pos.peca.fita_borda_larg1:
-                        ax.plot(
-                            [peca_pos.x, peca_pos.x],
-                            [peca_pos.y, peca_pos.y + peca_pos.largura_final],
-                            color='#8B4513',
-                            linewidth=espessura_fita,
-                            solid_capstyle='butt',
-                            zorder=4
-                        )
-                    
-                    # Borda direita (largura 2)
-                    if peca_pos.peca.fita_borda_larg2:
-                        ax.plot(
-                            [peca_pos.x + peca_pos.comprimento_final, peca_pos.x + peca_pos.comprimento_final],
-                            [peca_pos.y, peca_pos.y + peca_pos.largura_final],
-                            color='#8B4513',
-                            linewidth=espessura_fita,
-                            solid_capstyle='butt',
-                            zorder=4
-                        )
+                    if peca_pos.peca.fita_borda_comp1:  # Borda superior
+                        fitas.append([(x0, y1), (x1, y1)])
+                    if peca_pos.peca.fita_borda_comp2:  # Borda inferior
+                        fitas.append([(x0, y0), (x1, y0)])
+                    if peca_pos.peca.fita_borda_larg1:  # Borda esquerda
+                        fitas.append([(x0, y0), (x0, y1)])
+                    if peca_pos.peca.fita_borda_larg2:  # Borda direita
+                        fitas.append([(x1, y0), (x1, y1)])
                 
                 # Linhas de corte verticais (tracejadas)
                 if peca_pos.x > 0:
-                    ax.plot(
-                        [peca_pos.x, peca_pos.x],
-                        [peca_pos.y, peca_pos.y + peca_pos.largura_final],
-                        color=self.COR_LINHA_TRACEJADA,
-                        linestyle='--',
-                        linewidth=0.8,
-                        alpha=0.6,
-                        zorder=2
-                    )
+                    cortes.append([(x0, y0), (x0, y1)])
                 
                 # Texto da peça (nome e dimensões)
                 centro_x = peca_pos.x + peca_pos.comprimento_final / 2
@@ -512,12 +560,43 @@ class GeradorDiagrama:
                     zorder=5
                 )
         
+        ax.add_collection(LineCollection(
+            cortes,
+            colors=self.COR_LINHA_TRACEJADA,
+            linestyles='--',
+            linewidths=0.8,
+            alpha=0.6,
+            zorder=2
+        ))
+        ax.add_collection(PatchCollection(
+            retangulos,
+            linewidths=1.5,
+            edgecolors=self.COR_LINHA,
+            facecolors=self.COR_PECA,
+            zorder=3
+        ))
+        ax.add_collection(LineCollection(
+            fitas,
+            colors='#8B4513',  # Marrom (cor de fita de borda)
+            linewidths=4,  # Espessura visual da linha de fita
+            capstyle='butt',
+            zorder=4
+        ))
+        
         # Adicionar cabeçalho técnico
         self._adicionar_cabecalho(ax)
         
-        plt.tight_layout(pad=0.5)
+        fig.tight_layout(pad=0.5)
         return fig
     
+    def gerar_png(self, dpi: int = 150) -> bytes:
+        """PNG do diagrama; não usa estado do Streamlit, então pode rodar em
+        outra thread ou processo"""
+        fig = self.gerar_diagrama(dpi=dpi)
+        with BytesIO() as buf:
+            fig.savefig(buf, format='png', dpi=dpi, bbox_inches='tight')
+            return buf.getvalue()
+    
     def _adicionar_cabecalho(self, ax):
         """Adiciona cabeçalho técnico ao diagrama"""
         # Título
@@ -615,6 +694,131 @@ class GeradorDiagrama:
                     fontsize=7,
                     color=self.COR_LINHA
                 )
+    
+    def desenhar_diagrama_pdf(self, pdf, x0: float, y0: float, largura: float, altura: float,
+                              topo: bool = False) -> float:
+        """Desenha o diagrama direto no canvas do reportlab, em vetor, centralizado
+        na caixa (x0, y0, largura, altura) em pontos (com topo=True, encostado no
+        alto da caixa). Mesmo visual de gerar_diagrama, sem passar por matplotlib
+        nem PNG. As fontes padrão do PDF não têm o símbolo ↻, então peças
+        rotacionadas levam "(R)". Devolve o y mais baixo desenhado (legenda inclusa)."""
+        from reportlab.lib.colors import HexColor
+        
+        chapa = self.chapa
+        altura_cabecalho = 40
+        escala = min(largura / chapa.comprimento, (altura - altura_cabecalho) / chapa.largura)
+        largura_chapa = chapa.comprimento * escala
+        altura_chapa = chapa.largura * escala
+        cx = x0 + (largura - largura_chapa) / 2
+        folga = altura - altura_cabecalho - altura_chapa
+        cy = y0 + (folga if topo else folga / 2)
+        
+        def ponto(x, y):
+            return cx + x * escala, cy + y * escala
+        
+        pecas = [peca_pos for faixa in chapa.faixas for peca_pos in faixa.pecas]
+        
+        # Cabeçalho técnico
+        pdf.setFillColor(HexColor(self.COR_LINHA))
+        pdf.setFont("Helvetica-Bold", 12)
+        pdf.drawCentredString(cx + largura_chapa / 2, cy + altura_chapa + 22,
+                              f"DIAGRAMA DE OTIMIZAÇÃO — CHAPA {chapa.numero}")
+        pdf.setFont("Helvetica", 8)
+        pdf.drawCentredString(
+            cx + largura_chapa / 2, cy + altura_chapa + 8,
+            f"MDF {int(chapa.espessura)}mm  |  "
+            f"Chapa: {int(chapa.comprimento)} × {int(chapa.largura)} mm  |  "
+            f"Kerf: {chapa.kerf}mm  |  "
+            f"Aproveitamento: {chapa.calcular_utilizacao():.1f}%"
+        )
+        
+        # Chapa (fundo cinza)
+        pdf.setStrokeColor(HexColor(self.COR_LINHA))
+        pdf.setFillColor(HexColor(self.COR_CHAPA))
+        pdf.setLineWidth(1.5)
+        pdf.rect(cx, cy, largura_chapa, altura_chapa, stroke=1, fill=1)
+        
+        # Linhas tracejadas das faixas e dos cortes verticais (por baixo das peças)
+        pdf.saveState()
+        pdf.setStrokeColor(HexColor(self.COR_LINHA_TRACEJADA))
+        pdf.setStrokeAlpha(0.6)
+        pdf.setLineWidth(0.5)
+        pdf.setDash(3, 2)
+        for faixa in chapa.faixas:
+            pdf.line(*ponto(0, faixa.y_inicio), *ponto(chapa.comprimento, faixa.y_inicio))
+        for peca_pos in pecas:
+            if peca_pos.x > 0:
+                pdf.line(*ponto(peca_pos.x, peca_pos.y),
+                         *ponto(peca_pos.x, peca_pos.y + peca_pos.largura_final))
+        pdf.restoreState()
+        
+        # Peças (laranja)
+        pdf.setStrokeColor(HexColor(self.COR_LINHA))
+        pdf.setFillColor(HexColor(self.COR_PECA))
+        pdf.setLineWidth(0.8)
+        for peca_pos in pecas:
+            pdf.rect(*ponto(peca_pos.x, peca_pos.y),
+                     peca_pos.comprimento_final * escala, peca_pos.largura_final * escala,
+                     stroke=1, fill=1)
+        
+        # Fitas de borda (linhas grossas marrons)
+        pdf.setStrokeColor(HexColor('#8B4513'))
+        pdf.setLineWidth(2.5)
+        pdf.setLineCap(0)
+        for peca_pos in pecas:
+            peca = peca_pos.peca
+            if not peca.tem_fita():
+                continue
+            x1, y1 = peca_pos.x, peca_pos.y
+            x2, y2 = x1 + peca_pos.comprimento_final, y1 + peca_pos.largura_final
+            if peca.fita_borda_comp1:
+                pdf.line(*ponto(x1, y2), *ponto(x2, y2))
+            if peca.fita_borda_comp2:
+                pdf.line(*ponto(x1, y1), *ponto(x2, y1))
+            if peca.fita_borda_larg1:
+                pdf.line(*ponto(x1, y1), *ponto(x1, y2))
+            if peca.fita_borda_larg2:
+                pdf.line(*ponto(x2, y1), *ponto(x2, y2))
+        
+        # Nome e dimensões (originais) de cada peça
+        pdf.setFillColor(HexColor(self.COR_TEXTO))
+        for peca_pos in pecas:
+            centro_x, centro_y = ponto(peca_pos.x + peca_pos.comprimento_final / 2,
+                                       peca_pos.y + peca_pos.largura_final / 2)
+            deslocamento = peca_pos.largura_final * escala * 0.15
+            nome_exibir = peca_pos.peca.nome + (" (R)" if peca_pos.rotacionada else "")
+            pdf.setFont("Helvetica-Bold", 6)
+            pdf.drawCentredString(centro_x, centro_y + deslocamento - 2, nome_exibir)
+            pdf.setFont("Helvetica", 5)
+            pdf.drawCentredString(centro_x, centro_y - deslocamento - 2,
+                                  f"{int(peca_pos.peca.comprimento)} × {int(peca_pos.peca.largura)} mm")
+        
+        # Legenda abaixo da chapa, à direita
+        tem_fita = any(peca_pos.peca.tem_fita() for peca_pos in pecas)
+        tem_rotacao = any(peca_pos.rotacionada for peca_pos in pecas)
+        if tem_fita or tem_rotacao:
+            legenda_x = cx + largura_chapa * 0.82
+            y = cy - 12
+            pdf.setFillColor(HexColor(self.COR_LINHA))
+            pdf.setFont("Helvetica-Bold", 7)
+            pdf.drawString(legenda_x, y, "Legenda:")
+            pdf.setFont("Helvetica", 6)
+            if tem_fita:
+                y -= 10
+                pdf.line(legenda_x, y + 2, legenda_x + 20, y + 2)
+                pdf.drawString(legenda_x + 25, y, "Fita de Borda")
+            if tem_rotacao:
+                y -= 10
+                pdf.drawString(legenda_x, y, "(R) Peça Rotacionada")
+            return y - 4
+        return cy
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def render_chapa_png(assinatura: tuple, _chapa: Chapa, dpi: int = 100) -> bytes:
+    """PNG do diagrama da chapa; a chave do cache é só a `assinatura` do layout,
+    então reruns e PDFs do mesmo resultado não redesenham no matplotlib"""
+    return GeradorDiagrama(_chapa).gerar_png(dpi=dpi)
 
 
 # ============================================================================
@@ -629,6 +833,9 @@ class GeradorEtiquetas:
     
     def gerar_etiquetas_pdf(self) -> BytesIO:
         """Gera PDF com etiquetas (9 por página A4)"""
+        from reportlab.lib.pagesizes import A4
+        from reportlab.pdfgen import canvas
+        
         buffer = BytesIO()
         pdf = canvas.Canvas(buffer, pagesize=A4)
         largura_pagina, altura_pagina = A4
@@ -759,6 +966,9 @@ class GeradorPDF:
     
     def gerar_pdf(self) -> BytesIO:
         """Gera PDF com todas as chapas e resumo de materiais"""
+        from reportlab.lib.pagesizes import A4
+        from reportlab.pdfgen import canvas
+        
         buffer = BytesIO()
         pdf = canvas.Canvas(buffer, pagesize=A4)
         largura_pagina, altura_pagina = A4
@@ -768,39 +978,9 @@ class GeradorPDF:
         # ====================================================================
         
         for chapa in self.chapas:
-            # Gerar diagrama
-            gerador = GeradorDiagrama(chapa)
-            fig = gerador.gerar_diagrama(dpi=150)
-            
-            # Converter figura para imagem usando savefig
-            img_buffer = BytesIO()
-            fig.savefig(img_buffer, format='png', dpi=150, bbox_inches='tight')
-            img_buffer.seek(0)
-            
-            # Abrir com PIL e converter para ImageReader
-            pil_image = Image.open(img_buffer)
-            img_reader = ImageReader(pil_image)
-            
-            # Calcular dimensões para centralizar na página
-            img_width, img_height = pil_image.size
-            scale = min(
-                (largura_pagina - 50) / img_width,
-                (altura_pagina - 100) / img_height
-            )
-            
-            nova_largura = img_width * scale
-            nova_altura = img_height * scale
-            
-            x = (largura_pagina - nova_largura) / 2
-            y = (altura_pagina - nova_altura) / 2 + 20
-            
-            # Desenhar imagem no PDF
-            pdf.drawImage(
-                img_reader,
-                x, y,
-                width=nova_largura,
-                height=nova_altura,
-                preserveAspectRatio=True
+            # Diagrama em vetor direto no canvas (sem matplotlib/PNG)
+            GeradorDiagrama(chapa).desenhar_diagrama_pdf(
+                pdf, 25, 50, largura_pagina - 50, altura_pagina - 100
             )
             
             # Adicionar rodapé
@@ -814,10 +994,6 @@ class GeradorPDF:
             
             # Próxima página
             pdf.showPage()
-            
-            # Limpar figura
-            plt.close(fig)
-            img_buffer.close()
         
         # ====================================================================
         # PÁGINA DE RESUMO DE MATERIAIS E CUSTOS
@@ -1263,35 +1439,35 @@ def main():
         
         # Criar DataFrame com informações de fita
         def formatar_fita(peca):
-            bordas = []
-            if peca.fita_borda_comp1:
-                bordas.append("▲")
-            if peca.fita_borda_comp2:
-                bordas.append("▼")
-            if peca.fita_borda_larg1:
-                bordas.append("◀")
-            if peca.fita_borda_larg2:
-                bordas.append("▶")
-            return " ".join(bordas) if bordas else "-"
-        
-        df_pecas = pd.DataFrame([
-            {
-                "Nome": p.nome,
-                "Comprimento (mm)": int(p.comprimento),
-                "Largura (mm)": int(p.largura),
-                "Quantidade": p.quantidade,
-                "Fita de Borda": formatar_fita(p),
-                "Veio": "🌾" if p.respeitar_veio else "-",
-                "Fita Total (m)": round(p.comprimento_fita() * p.quantidade / 1000, 2),
-                "Área Total (m²)": round(p.area() * p.quantidade / 1_000_000, 3)
-            }
-            for p in st.session_state.pecas
-        ])
+            return Peca.bordas_str(peca.fita_borda_comp1, peca.fita_borda_comp2,
+                                   peca.fita_borda_larg1, peca.fita_borda_larg2)
+        
+        # Colunas numéricas montadas uma vez em arrays: fita e área saem de
+        # operações vetorizadas em vez de um cálculo por peça
+        pecas = st.session_state.pecas
+        n = len(pecas)
+        comp = np.fromiter((p.comprimento for p in pecas), dtype=float, count=n)
+        larg = np.fromiter((p.largura for p in pecas), dtype=float, count=n)
+        qtd = np.fromiter((p.quantidade for p in pecas), dtype=int, count=n)
+        lados_comp = np.fromiter((p.fita_borda_comp1 + p.fita_borda_comp2 for p in pecas), dtype=int, count=n)
+        lados_larg = np.fromiter((p.fita_borda_larg1 + p.fita_borda_larg2 for p in pecas), dtype=int, count=n)
+        fita_mm = (lados_comp * comp + lados_larg * larg) * qtd
+        
+        df_pecas = pd.DataFrame({
+            "Nome": [p.nome for p in pecas],
+            "Comprimento (mm)": comp.astype(int),
+            "Largura (mm)": larg.astype(int),
+            "Quantidade": qtd,
+            "Fita de Borda": [formatar_fita(p) for p in pecas],
+            "Veio": ["🌾" if p.respeitar_veio else "-" for p in pecas],
+            "Fita Total (m)": np.round(fita_mm / 1000, 2),
+            "Área Total (m²)": np.round(comp * larg * qtd / 1_000_000, 3)
+        })
         
         st.dataframe(df_pecas, use_container_width=True, hide_index=True)
         
         # Resumo de fita de borda
-        total_fita = sum(p.comprimento_fita() * p.quantidade for p in st.session_state.pecas)
+        total_fita = float(fita_mm.sum())
         if total_fita > 0:
             total_fita_metros = total_fita / 1000
             rolos_necessarios = -(-total_fita_metros // comprimento_rolo_fita)  # Arredonda para cima
@@ -1356,7 +1532,7 @@ def main():
                 st.rerun()
         
         with col2:
-            total_pecas = sum(p.quantidade for p in st.session_state.pecas)
+            total_pecas = int(qtd.sum())
             st.metric("Total de Peças", total_pecas)
         
         # ====================================================================
@@ -1432,11 +1608,8 @@ def main():
                 f"📄 Chapa {chapa.numero} - Aproveitamento: {chapa.calcular_utilizacao():.1f}%",
                 expanded=True
             ):
-                # Gerar e exibir diagrama
-                gerador = GeradorDiagrama(chapa)
-                fig = gerador.gerar_diagrama(dpi=100)
-                st.pyplot(fig)
-                plt.close(fig)
+                # Exibir diagrama (PNG em cache pela assinatura do layout)
+                st.image(render_chapa_png(chapa.assinatura(), chapa))
                 
                 # Calcular fita de borda desta chapa
                 fita_chapa = sum(
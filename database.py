@@ -3,7 +3,7 @@ Database Models - Corte Certo
 Sistema de banco de dados com SQLAlchemy
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, DateTime, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
@@ -40,6 +40,10 @@ class Cliente(Base):
 class TipoChapa(Base):
     """Modelo para tipos de chapa MDF"""
     __tablename__ = 'tipos_chapa'
+    __table_args__ = (
+        # Listagem: WHERE ativo = 1 ORDER BY nome sai direto do índice
+        Index('ix_tipo_chapa_ativo_nome', 'ativo', 'nome'),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     nome = Column(String(100), nullable=False)  # Ex: "MDF Cru 15mm"
@@ -65,6 +69,9 @@ class TipoChapa(Base):
 class TipoFita(Base):
     """Modelo para tipos de fita de borda"""
     __tablename__ = 'tipos_fita'
+    __table_args__ = (
+        Index('ix_tipo_fita_ativo_nome', 'ativo', 'nome'),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     nome = Column(String(100), nullable=False)  # Ex: "Fita Branca 22mm"
@@ -172,6 +179,11 @@ class DatabaseManager:
         self.db_path = db_path
         self.engine = create_engine(f'sqlite:///{db_path}', echo=False)
         Base.metadata.create_all(self.engine)
+        # create_all não mexe em tabelas já existentes: garante os índices
+        # novos também nos bancos criados antes deles (CREATE INDEX IF NOT EXISTS)
+        for tabela in (TipoChapa.__table__, TipoFita.__table__):
+            for indice in tabela.indexes:
+                indice.create(self.engine, checkfirst=True)
         self.Session = sessionmaker(bind=self.engine)
     
     def get_session(self):
@@ -6,8 +6,15 @@ Versão 2.0 - Com Cadastros e Banco de Dados
 import streamlit as st
 import sys
 import os
-import matplotlib.pyplot as plt
+import math
+import hashlib
 import pandas as pd
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import List, Optional, Tuple
+from sqlalchemy import create_engine, delete, event, func, select, update
+from sqlalchemy.orm import selectinload, sessionmaker
 
 # Adicionar diretório ao path para importar módulos
 sys.path.insert(0, os.path.dirname(__file__))
@@ -15,11 +22,20 @@ sys.path.insert(0, os.path.dirname(__file__))
 # Importar database
 from database import db_manager, Cliente, TipoChapa, TipoFita, Projeto, PecaProjeto
 
-# Importar módulos do sistema antigo
+# Importar módulos do sistema antigo (uma vez por processo, não a cada rerun)
 import importlib.util
-spec = importlib.util.spec_from_file_location("corte_certo_engine", "corte_certo.py")
-engine = importlib.util.module_from_spec(spec)
-spec.loader.exec_module(engine)
+
+@st.cache_resource
+def load_engine():
+    spec = importlib.util.spec_from_file_location("corte_certo", "corte_certo.py")
+    m = importlib.util.module_from_spec(spec)
+    # Registrado com o nome do arquivo para que o pickle do st.cache_data
+    # encontre o módulo de Chapa/Peca ao serializar os resultados
+    sys.modules[spec.name] = m
+    spec.loader.exec_module(m)
+    return m
+
+engine = load_engine()
 
 # ============================================================================
 # CONFIGURAÇÃO DA PÁGINA
@@ -39,6 +55,25 @@ st.set_page_config(
 # Criar dados de exemplo na primeira execução
 db_manager.criar_dados_exemplo()
 
+@st.cache_resource
+def get_sessionmaker():
+    """Engine + fábrica de sessões compartilhadas entre reruns e sessões do Streamlit"""
+    engine = create_engine(f'sqlite:///{db_manager.db_path}', pool_size=10, max_overflow=5,
+                           pool_pre_ping=True)
+    
+    # WAL: leituras dos reruns não esperam as gravações; vale para toda conexão do pool
+    @event.listens_for(engine, "connect")
+    def _pragmas(dbapi_connection, _):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+    
+    return sessionmaker(bind=engine, expire_on_commit=False)
+
+SessionLocal = get_sessionmaker()
+
 # ============================================================================
 # FUNÇÕES AUXILIARES
 # ============================================================================
@@ -86,6 +121,21 @@ def menu_lateral():
 # TELA: CADASTRO DE CLIENTES
 # ============================================================================
 
+@st.cache_data(ttl=30)
+def listar_clientes():
+    """Lista de clientes (id, nome, telefone, email, cpf_cnpj, endereco) ordenada por nome"""
+    session = db_manager.get_session()
+    try:
+        return [
+            tuple(row) for row in session.execute(
+                select(Cliente.id, Cliente.nome, Cliente.telefone, Cliente.email,
+                       Cliente.cpf_cnpj, Cliente.endereco).order_by(Cliente.nome)
+            )
+        ]
+    finally:
+        session.close()
+
+
 def tela_clientes():
     """Tela de cadastro e gerenciamento de clientes"""
     st.title("👤 Cadastro de Clientes")
@@ -93,20 +143,21 @@ def tela_clientes():
     tab1, tab2 = st.tabs(["📋 Lista de Clientes", "➕ Novo Cliente"])
     
     with tab1:
-        session = db_manager.get_session()
-        clientes = session.query(Cliente).order_by(Cliente.nome).all()
+        clientes = listar_clientes()
         
         if clientes:
             st.subheader(f"Total: {len(clientes)} cliente(s)")
             
+            id_to_nome = {c[0]: c[1] for c in clientes}
+            
             # Seleção e botões de ação ACIMA
             col1, col2, col3 = st.columns([4, 1, 1])
             
             with col1:
                 cliente_id = st.selectbox(
                     "Selecione um cliente:",
-                    options=[c.id for c in clientes],
-                    format_func=lambda x: next(c.nome for c in clientes if c.id == x),
+                    options=list(id_to_nome),
+                    format_func=id_to_nome.get,
                     key="select_cliente"
                 )
             
@@ -124,22 +175,20 @@ def tela_clientes():
             
             # Grid EMBAIXO
             dados_grid = []
-            for cliente in clientes:
+            for c_id, c_nome, telefone, email, cpf_cnpj, endereco in clientes:
                 dados_grid.append({
-                    'ID': cliente.id,
-                    'Nome': cliente.nome,
-                    'Telefone': cliente.telefone or '-',
-                    'Email': cliente.email or '-',
-                    'CPF/CNPJ': cliente.cpf_cnpj or '-',
-                    'Endereço': cliente.endereco or '-',
+                    'ID': c_id,
+                    'Nome': c_nome,
+                    'Telefone': telefone or '-',
+                    'Email': email or '-',
+                    'CPF/CNPJ': cpf_cnpj or '-',
+                    'Endereço': endereco or '-',
                 })
             
             df = pd.DataFrame(dados_grid)
             st.dataframe(df, use_container_width=True, hide_index=True)
         else:
             st.info("Nenhum cliente cadastrado ainda.")
-        
-        session.close()
     
     with tab2:
         # Mostrar mensagem de sucesso se houver
@@ -182,6 +231,7 @@ def tela_clientes():
                     session.add(novo_cliente)
                     session.commit()
                     session.close()
+                    listar_clientes.clear()
                     st.session_state.msg_sucesso_cliente = f"✅ Cliente '{nome}' cadastrado com sucesso!"
                     st.rerun()
     
@@ -193,26 +243,46 @@ def tela_clientes():
         modal_excluir_cliente()
 
 
+@st.cache_data(ttl=10)
+def carregar_cliente(cliente_id):
+    """Snapshot (dict) de um cliente, ou None se não existir"""
+    session = db_manager.get_session()
+    try:
+        cliente = session.get(Cliente, cliente_id)
+        if cliente is None:
+            return None
+        return {
+            'nome': cliente.nome,
+            'telefone': cliente.telefone,
+            'email': cliente.email,
+            'endereco': cliente.endereco,
+            'cpf_cnpj': cliente.cpf_cnpj,
+            'observacoes': cliente.observacoes,
+        }
+    finally:
+        session.close()
+
+
 @st.dialog("✏️ Editar Cliente")
 def modal_editar_cliente():
     """Modal para editar cliente"""
-    session = db_manager.get_session()
-    cliente = session.query(Cliente).get(st.session_state.editing_cliente_id)
+    cliente_id = st.session_state.editing_cliente_id
+    cliente = carregar_cliente(cliente_id)
     
     if cliente:
         with st.form("form_edit_cliente"):
-            nome = st.text_input("Nome *", value=cliente.nome)
+            nome = st.text_input("Nome *", value=cliente['nome'])
             
             col1, col2 = st.columns(2)
             with col1:
-                telefone = st.text_input("Telefone", value=cliente.telefone or "")
-                cpf_cnpj = st.text_input("CPF/CNPJ", value=cliente.cpf_cnpj or "")
+                telefone = st.text_input("Telefone", value=cliente['telefone'] or "")
+                cpf_cnpj = st.text_input("CPF/CNPJ", value=cliente['cpf_cnpj'] or "")
             
             with col2:
-                email = st.text_input("Email", value=cliente.email or "")
-                endereco = st.text_input("Endereço", value=cliente.endereco or "")
+                email = st.text_input("Email", value=cliente['email'] or "")
+                endereco = st.text_input("Endereço", value=cliente['endereco'] or "")
             
-            observacoes = st.text_area("Observações", value=cliente.observacoes or "")
+            observacoes = st.text_area("Observações", value=cliente['observacoes'] or "")
             
             col_btn1, col_btn2 = st.columns(2)
             
@@ -226,604 +296,330 @@ def modal_editar_cliente():
                 if not nome:
                     st.error("❌ Nome é obrigatório!")
                 else:
-                    cliente.nome = nome
-                    cliente.telefone = telefone
-                    cliente.email = email
-                    cliente.endereco = endereco
-                    cliente.cpf_cnpj = cpf_cnpj
-                    cliente.observacoes = observacoes
+                    session = db_manager.get_session()
+                    registro = session.get(Cliente, cliente_id)
+                    registro.nome = nome
+                    registro.telefone = telefone
+                    registro.email = email
+                    registro.endereco = endereco
+                    registro.cpf_cnpj = cpf_cnpj
+                    registro.observacoes = observacoes
                     session.commit()
                     session.close()
+                    listar_clientes.clear()
+                    carregar_cliente.clear()
                     del st.session_state.editing_cliente_id
                     st.success("✅ Cliente atualizado com sucesso!")
                     st.rerun()
             
             if cancel:
-                session.close()
                 del st.session_state.editing_cliente_id
                 st.rerun()
-    else:
-        session.close()
 
 
 @st.dialog("🗑️ Excluir Cliente")
 def modal_excluir_cliente():
     """Modal para confirmar exclusão de cliente"""
-    session = db_manager.get_session()
-    cliente = session.query(Cliente).get(st.session_state.deleting_cliente_id)
+    cliente_id = st.session_state.deleting_cliente_id
+    cliente = carregar_cliente(cliente_id)
     
     if cliente:
-        st.warning(f"⚠️ Tem certeza que deseja excluir o cliente **{cliente.nome}**?")
+        st.warning(f"⚠️ Tem certeza que deseja excluir o cliente **{cliente['nome']}**?")
         st.write("Esta ação não pode ser desfeita.")
         
         col1, col2 = st.columns(2)
         
         with col1:
             if st.button("✅ Sim, excluir", key="confirm_del", use_container_width=True, type="primary"):
-                session.delete(cliente)
+                session = db_manager.get_session()
+                session.delete(session.get(Cliente, cliente_id))
                 session.commit()
                 session.close()
+                listar_clientes.clear()
+                carregar_cliente.clear()
                 del st.session_state.deleting_cliente_id
                 st.success("✅ Cliente excluído com sucesso!")
                 st.rerun()
         
         with col2:
             if st.button("❌ Cancelar", key="cancel_del", use_container_width=True):
-                session.close()
                 del st.session_state.deleting_cliente_id
                 st.rerun()
-    else:
-        session.close()
 
 # ============================================================================
-# TELA: CADASTRO DE CHAPAS
+# TELA: CADASTROS DE CHAPAS E FITAS
 # ============================================================================
 
-def tela_chapas():
-    """Tela de cadastro de tipos de chapa"""
-    st.title("📦 Cadastro de Tipos de Chapa MDF")
-    
-    tab1, tab2 = st.tabs(["📋 Chapas Cadastradas", "➕ Nova Chapa"])
-    
-    with tab1:
-        session = db_manager.get_session()
-        chapas = session.query(TipoChapa).filter_by(ativo=True).order_by(TipoChapa.nome).all()
-        
-        if chapas:
-            st.subheader(f"Total: {len(chapas)} tipo(s) de chapa")
-            
-            # Seleção e botões ACIMA
-            col1, col2, col3 = st.columns([4, 1, 1])
-            
-            with col1:
-                chapa_id = st.selectbox(
-                    "Selecione uma chapa:",
-                    options=[c.id for c in chapas],
-                    format_func=lambda x: next(c.nome for c in chapas if c.id == x),
-                    key="select_chapa"
-                )
-            
-            with col2:
-                if st.button("✏️ Editar", key="btn_edit_chapa", use_container_width=True):
-                    st.session_state.editing_chapa_id = chapa_id
-                    st.rerun()
-            
-            with col3:
-                if st.button("🗑️ Excluir", key="btn_del_chapa", use_container_width=True):
-                    st.session_state.deleting_chapa_id = chapa_id
-                    st.rerun()
-            
-            st.markdown("---")
-            
-            # Grid EMBAIXO
-            dados_grid = []
-            for chapa in chapas:
-                dados_grid.append({
-                    'ID': chapa.id,
-                    'Nome': chapa.nome,
-                    'Dimensões (mm)': f"{int(chapa.comprimento)}×{int(chapa.largura)}×{int(chapa.espessura)}",
-                    'Cor': chapa.cor or '-',
-                    'Acabamento': chapa.acabamento or '-',
-                    'Preço (R$)': f"R$ {chapa.preco:.2f}",
-                    'Fornecedor': chapa.fornecedor or '-',
-                })
-            
-            df = pd.DataFrame(dados_grid)
-            st.dataframe(df, use_container_width=True, hide_index=True)
-        else:
-            st.info("Nenhuma chapa cadastrada.")
-        
-        session.close()
-    
-    with tab2:
-        # Mostrar mensagem de sucesso se houver
-        if 'msg_sucesso_chapa' in st.session_state:
-            st.success(st.session_state.msg_sucesso_chapa)
-            st.balloons()
-            del st.session_state.msg_sucesso_chapa
-        
-        with st.form("form_chapa"):
-            st.subheader("Dados da Chapa")
-            
-            nome = st.text_input("Nome/Descrição *", placeholder="Ex: MDF Branco 15mm")
-            
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                comprimento = st.number_input("Comprimento (mm) *", min_value=100, max_value=5000, value=2750, step=50)
-            with col2:
-                largura = st.number_input("Largura (mm) *", min_value=100, max_value=5000, value=1840, step=50)
-            with col3:
-                espessura = st.number_input("Espessura (mm) *", min_value=3, max_value=50, value=15, step=1)
-            
-            col4, col5 = st.columns(2)
-            with col4:
-                cor = st.text_input("Cor", placeholder="Ex: Branco, Preto, Natural")
-                fornecedor = st.text_input("Fornecedor", placeholder="Ex: Duratex, Berneck")
-            
-            with col5:
-                acabamento = st.text_input("Acabamento", placeholder="Ex: BP, Cru, Laca")
-                preco = st.number_input("Preço (R$) *", min_value=0.0, max_value=10000.0, value=180.0, step=10.0)
-            
-            observacoes = st.text_area("Observações")
-            
-            submit = st.form_submit_button("💾 Salvar Chapa", use_container_width=True)
-            
-            if submit:
-                if not nome:
-                    st.error("❌ Nome é obrigatório!")
-                else:
-                    session = db_manager.get_session()
-                    nova_chapa = TipoChapa(
-                        nome=nome,
-                        comprimento=comprimento,
-                        largura=largura,
-                        espessura=espessura,
-                        preco=preco,
-                        cor=cor,
-                        acabamento=acabamento,
-                        fornecedor=fornecedor,
-                        observacoes=observacoes
-                    )
-                    session.add(nova_chapa)
-                    session.commit()
-                    session.close()
-                    st.session_state.msg_sucesso_chapa = f"✅ Chapa '{nome}' cadastrada com sucesso!"
-                    st.rerun()
-                    st.rerun()
-    
-    # Modals
-    if 'editing_chapa_id' in st.session_state:
-        modal_editar_chapa()
-    
-    if 'deleting_chapa_id' in st.session_state:
-        modal_excluir_chapa()
+@dataclass
+class Campo:
+    """Campo dos formulários de cadastro e edição"""
+    nome: str  # atributo do modelo
+    rotulo: str
+    tipo: str  # 'texto', 'area', 'int' ou 'float'
+    coluna: Optional[int] = None  # posição na linha de 5 colunas; None = largura total
+    opcoes: dict = field(default_factory=dict)  # kwargs do widget no cadastro
 
 
-@st.dialog("✏️ Editar Chapa")
-def modal_editar_chapa():
-    """Modal para editar chapa"""
-    session = db_manager.get_session()
-    chapa = session.query(TipoChapa).get(st.session_state.editing_chapa_id)
-    
-    if chapa:
-        with st.form("form_edit_chapa"):
-            nome = st.text_input("Nome/Descrição *", value=chapa.nome)
-            
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                comprimento = st.number_input("Comprimento (mm) *", min_value=100, max_value=5000, 
-                                            value=int(chapa.comprimento), step=50)
-            with col2:
-                largura = st.number_input("Largura (mm) *", min_value=100, max_value=5000, 
-                                        value=int(chapa.largura), step=50)
-            with col3:
-                espessura = st.number_input("Espessura (mm) *", min_value=3, max_value=50, 
-                                          value=int(chapa.espessura), step=1)
-            
-            col4, col5 = st.columns(2)
-            with col4:
-                cor = st.text_input("Cor", value=chapa.cor or "")
-                fornecedor = st.text_input("Fornecedor", value=chapa.fornecedor or "")
-            
-            with col5:
-                acabamento = st.text_input("Acabamento", value=chapa.acabamento or "")
-                preco = st.number_input("Preço (R$) *", min_value=0.0, max_value=10000.0, 
-                                       value=float(chapa.preco), step=10.0)
-            
-            observacoes = st.text_area("Observações", value=chapa.observacoes or "")
-            
-            col_btn1, col_btn2 = st.columns(2)
-            
-            with col_btn1:
-                submit = st.form_submit_button("💾 Salvar", use_container_width=True, type="primary")
-            
-            with col_btn2:
-                cancel = st.form_submit_button("❌ Cancelar", use_container_width=True)
-            
-            if submit:
-                if not nome:
-                    st.error("❌ Nome é obrigatório!")
-                else:
-                    chapa.nome = nome
-                    chapa.comprimento = comprimento
-                    chapa.largura = largura
-                    chapa.espessura = espessura
-                    chapa.preco = preco
-                    chapa.cor = cor
-                    chapa.acabamento = acabamento
-                    chapa.fornecedor = fornecedor
-                    chapa.observacoes = observacoes
-                    session.commit()
-                    session.close()
-                    del st.session_state.editing_chapa_id
-                    st.success("✅ Chapa atualizada com sucesso!")
-                    st.rerun()
-            
-            if cancel:
-                session.close()
-                del st.session_state.editing_chapa_id
-                st.rerun()
-    else:
-        session.close()
+@dataclass
+class CrudSpec:
+    """Cadastro simples: grid dos ativos, formulário novo, edição e exclusão lógica"""
+    model: type
+    chave: str  # 'chapa' -> editing_chapa_id, btn_edit_chapa...
+    label: str
+    titulo: str
+    colunas_grid: List[Tuple]  # (coluna ORM, título no grid)
+    colunas_int: Tuple[str, ...]
+    colunas_texto: Tuple[str, ...]  # vazias viram '-'
+    column_config: dict
+    campos: List[Campo]
+    
+    @property
+    def tabela(self):
+        return f'{self.chave}s'
 
 
-@st.dialog("🗑️ Excluir Chapa")
-def modal_excluir_chapa():
-    """Modal para confirmar exclusão de chapa"""
-    session = db_manager.get_session()
-    chapa = session.query(TipoChapa).get(st.session_state.deleting_chapa_id)
+CRUD_SPECS = {
+    'chapa': CrudSpec(
+        model=TipoChapa,
+        chave='chapa',
+        label='Chapa',
+        titulo="📦 Cadastro de Tipos de Chapa MDF",
+        colunas_grid=[
+            (TipoChapa.id, 'ID'), (TipoChapa.nome, 'Nome'),
+            (TipoChapa.comprimento, 'Comprimento'), (TipoChapa.largura, 'Largura'),
+            (TipoChapa.espessura, 'Espessura'), (TipoChapa.cor, 'Cor'),
+            (TipoChapa.acabamento, 'Acabamento'), (TipoChapa.preco, 'Preço'),
+            (TipoChapa.fornecedor, 'Fornecedor'),
+        ],
+        colunas_int=('Comprimento', 'Largura', 'Espessura'),
+        colunas_texto=('Cor', 'Acabamento', 'Fornecedor'),
+        column_config={
+            'Comprimento': st.column_config.NumberColumn(format='%d mm'),
+            'Largura': st.column_config.NumberColumn(format='%d mm'),
+            'Espessura': st.column_config.NumberColumn(format='%d mm'),
+            'Preço': st.column_config.NumberColumn('Preço (R$)', format='R$ %.2f'),
+        },
+        campos=[
+            Campo('nome', "Nome/Descrição *", 'texto', opcoes=dict(placeholder="Ex: MDF Branco 15mm")),
+            Campo('comprimento', "Comprimento (mm) *", 'int', 0,
+                  dict(min_value=100, max_value=5000, value=2750, step=50)),
+            Campo('largura', "Largura (mm) *", 'int', 1,
+                  dict(min_value=100, max_value=5000, value=1840, step=50)),
+            Campo('espessura', "Espessura (mm) *", 'int', 2,
+                  dict(min_value=3, max_value=50, value=15, step=1)),
+            Campo('cor', "Cor", 'texto', 3, dict(placeholder="Ex: Branco, Preto, Natural")),
+            Campo('fornecedor', "Fornecedor", 'texto', 3, dict(placeholder="Ex: Duratex, Berneck")),
+            Campo('acabamento', "Acabamento", 'texto', 4, dict(placeholder="Ex: BP, Cru, Laca")),
+            Campo('preco', "Preço (R$) *", 'float', 4,
+                  dict(min_value=0.0, max_value=10000.0, value=180.0, step=10.0)),
+            Campo('observacoes', "Observações", 'area'),
+        ],
+    ),
+    'fita': CrudSpec(
+        model=TipoFita,
+        chave='fita',
+        label='Fita',
+        titulo="📏 Cadastro de Tipos de Fita de Borda",
+        colunas_grid=[
+            (TipoFita.id, 'ID'), (TipoFita.nome, 'Nome'),
+            (TipoFita.largura, 'Largura (mm)'), (TipoFita.comprimento_rolo, 'Rolo (m)'),
+            (TipoFita.preco_rolo, 'Preço/Rolo'), (TipoFita.cor, 'Cor'),
+            (TipoFita.material, 'Material'), (TipoFita.fornecedor, 'Fornecedor'),
+        ],
+        colunas_int=('Largura (mm)', 'Rolo (m)'),
+        colunas_texto=('Cor', 'Material', 'Fornecedor'),
+        column_config={
+            'Preço/Rolo': st.column_config.NumberColumn(format='R$ %.2f'),
+        },
+        campos=[
+            Campo('nome', "Nome/Descrição *", 'texto', opcoes=dict(placeholder="Ex: Fita Branca 22mm")),
+            Campo('largura', "Largura (mm) *", 'int', 0,
+                  dict(min_value=10, max_value=100, value=22, step=1)),
+            Campo('comprimento_rolo', "Comprimento/rolo (m) *", 'int', 1,
+                  dict(min_value=10, max_value=200, value=50, step=10)),
+            Campo('preco_rolo', "Preço/rolo (R$) *", 'float', 2,
+                  dict(min_value=0.0, max_value=1000.0, value=25.0, step=5.0)),
+            Campo('cor', "Cor", 'texto', 3, dict(placeholder="Ex: Branco, Preto, Amadeirado")),
+            Campo('fornecedor', "Fornecedor", 'texto', 3),
+            Campo('material', "Material", 'texto', 4, dict(placeholder="Ex: PVC, ABS, Melamínico")),
+            Campo('observacoes', "Observações", 'area'),
+        ],
+    ),
+}
+
+
+def _versao_tabela(spec) -> tuple:
+    """Marca do estado da tabela no banco (linhas, maior id, última alteração):
+    muda a cada gravação, venha ela de qualquer sessão"""
+    stmt = select(func.count(), func.max(spec.model.id), func.max(spec.model.atualizado_em))
+    with SessionLocal() as session:
+        return tuple(session.execute(stmt).one())
+
+
+@st.cache_data(ttl=300)
+def _load_grid(chave: str, versao: tuple) -> pd.DataFrame:
+    """Grid dos registros ativos; `versao` (_versao_tabela) invalida o cache após gravações"""
+    spec = CRUD_SPECS[chave]
+    colunas, titulos = zip(*spec.colunas_grid)
+    stmt = (select(*colunas)
+            .where(spec.model.ativo == True)
+            .order_by(spec.model.nome)
+            .execution_options(yield_per=500))
+    
+    # Linhas lidas em lotes direto para o DataFrame, sem lista intermediária
+    with SessionLocal() as session:
+        df = pd.DataFrame.from_records(session.execute(stmt), columns=list(titulos))
+    
+    # Números ficam crus: a formatação é do st.column_config da spec
+    for col in spec.colunas_int:
+        df[col] = df[col].astype(int)
+    for col in spec.colunas_texto:
+        df[col] = df[col].replace('', None).fillna('-')
+    
+    return df
+
+
+def _grid_sessao(spec):
+    """DataFrame do grid guardado na sessão com a versão da tabela no banco
+    (_versao_tabela); evita a cópia do st.cache_data enquanto nada mudou"""
+    ver = _versao_tabela(spec)
+    chave = f'_{spec.tabela}_df'
+    salvo = st.session_state.get(chave)
+    if salvo is None or salvo[0] != ver:
+        salvo = (ver, _load_grid(spec.chave, ver))
+        st.session_state[chave] = salvo
+    return salvo[1]
+
+
+def _limpar_caches_cadastro():
+    # Grids e listas do otimizador saem do cache, para todas as sessões
+    _load_grid.clear()
+    _load_chapas_ativas.clear()
+    _load_fitas_ativas.clear()
+
+
+def _insert_registros(session, model, dicts):
+    """Insere vários registros num único executemany (formulário hoje, importação amanhã)"""
+    session.bulk_insert_mappings(model, dicts)
+    session.commit()
+
+
+def _campos_formulario(spec, valores=None):
+    """Desenha os campos da spec (nome, linha de 5 colunas, observações) e devolve {campo: valor}.
+    
+    Sem `valores` é o formulário de cadastro (defaults/placeholders da spec);
+    com `valores` os widgets começam com os dados do registro em edição.
+    """
+    entrada = {}
+    colunas = None
+    for campo in spec.campos:
+        if campo.coluna is None:
+            alvo = st
+        else:
+            if colunas is None:
+                colunas = st.columns(5)
+            alvo = colunas[campo.coluna]
+        
+        opcoes = dict(campo.opcoes)
+        if valores is not None:
+            opcoes.pop('placeholder', None)
+            valor = valores[campo.nome]
+            if campo.tipo == 'int':
+                opcoes['value'] = int(valor)
+            elif campo.tipo == 'float':
+                opcoes['value'] = float(valor)
+            else:
+                opcoes['value'] = valor or ""
+        
+        if campo.tipo in ('int', 'float'):
+            entrada[campo.nome] = alvo.number_input(campo.rotulo, **opcoes)
+        elif campo.tipo == 'area':
+            entrada[campo.nome] = alvo.text_area(campo.rotulo, **opcoes)
+        else:
+            entrada[campo.nome] = alvo.text_input(campo.rotulo, **opcoes)
+    return entrada
+
+
+@st.fragment
+def _aba_lista(chave):
+    """Aba da listagem; selectbox e botões reexecutam só este fragmento"""
+    spec = CRUD_SPECS[chave]
+    df = _grid_sessao(spec)
     
-    if chapa:
-        st.warning(f"⚠️ Tem certeza que deseja excluir a chapa **{chapa.nome}**?")
-        st.write("Esta ação não pode ser desfeita.")
+    if not df.empty:
+        st.subheader(f"Total: {len(df)} tipo(s) de {spec.chave}")
         
-        col1, col2 = st.columns(2)
+        id_to_nome = dict(zip(df['ID'].tolist(), df['Nome'].tolist()))
+        
+        # Seleção e botões ACIMA
+        col1, col2, col3 = st.columns([4, 1, 1])
         
         with col1:
-            if st.button("✅ Sim, excluir", key="confirm_del_chapa", use_container_width=True, type="primary"):
-                chapa.ativo = False
-                session.commit()
-                session.close()
-                del st.session_state.deleting_chapa_id
-                st.success("✅ Chapa excluída com sucesso!")
-                st.rerun()
+            registro_id = st.selectbox(
+                f"Selecione uma {spec.chave}:",
+                options=list(id_to_nome),
+                format_func=id_to_nome.__getitem__,
+                key=f"select_{spec.chave}_list"
+            )
         
         with col2:
-            if st.button("❌ Cancelar", key="cancel_del_chapa", use_container_width=True):
-                session.close()
-                del st.session_state.deleting_chapa_id
+            st.markdown("<br>", unsafe_allow_html=True)  # 👈 alinha verticalmente
+            if st.button("✏️ Editar", key=f"btn_edit_{spec.chave}", use_container_width=True):
+                # Valores do formulário lidos uma vez aqui; os reruns do modal não consultam o banco
+                campos = [getattr(spec.model, c.nome) for c in spec.campos]
+                with SessionLocal() as session:
+                    st.session_state[f'edit_{spec.chave}_defaults'] = dict(session.execute(
+                        select(*campos).where(spec.model.id == registro_id)
+                    ).mappings().one())
+                st.session_state[f'editing_{spec.chave}_id'] = registro_id
                 st.rerun()
-    else:
-        session.close()
-    """Tela de cadastro de tipos de chapa"""
-    st.title("📦 Cadastro de Tipos de Chapa MDF")
-    
-    tab1, tab2 = st.tabs(["📋 Chapas Cadastradas", "➕ Nova Chapa"])
-    
-    with tab1:
-        session = db_manager.get_session()
-        chapas = session.query(TipoChapa).filter_by(ativo=True).order_by(TipoChapa.nome).all()
         
-        if chapas:
-            st.subheader(f"Total: {len(chapas)} tipo(s) de chapa")
-            
-            for chapa in chapas:
-                with st.expander(f"📦 {chapa.descricao_completa()}"):
-                    col1, col2 = st.columns([3, 1])
-                    
-                    with col1:
-                        st.markdown(f"**Dimensões:** {int(chapa.comprimento)} × {int(chapa.largura)} × {int(chapa.espessura)} mm")
-                        st.markdown(f"**Cor:** {chapa.cor or '-'}")
-                        st.markdown(f"**Acabamento:** {chapa.acabamento or '-'}")
-                        st.markdown(f"**Fornecedor:** {chapa.fornecedor or '-'}")
-                        st.markdown(f"**Preço:** R$ {chapa.preco:.2f}")
-                    
-                    with col2:
-                        # Botão Editar
-                        if st.button("✏️ Editar", key=f"edit_chapa_{chapa.id}", use_container_width=True):
-                            st.session_state.editing_chapa = chapa.id
-                            st.rerun()
-                        
-                        # Botão Excluir
-                        if st.button("🗑️ Excluir", key=f"del_chapa_{chapa.id}", use_container_width=True, type="secondary"):
-                            st.session_state.deleting_chapa = chapa.id
-                            st.rerun()
-            
-            # Modal de Edição
-            if 'editing_chapa' in st.session_state and st.session_state.editing_chapa:
-                chapa_edit = session.query(TipoChapa).get(st.session_state.editing_chapa)
-                
-                if chapa_edit:
-                    with st.container():
-                        st.markdown("---")
-                        st.subheader(f"✏️ Editando: {chapa_edit.nome}")
-                        
-                        with st.form(f"form_edit_chapa_{chapa_edit.id}"):
-                            nome = st.text_input("Nome/Descrição *", value=chapa_edit.nome)
-                            
-                            col1, col2, col3 = st.columns(3)
-                            with col1:
-                                comprimento = st.number_input("Comprimento (mm) *", min_value=100, max_value=5000, 
-                                                            value=int(chapa_edit.comprimento), step=50)
-                            with col2:
-                                largura = st.number_input("Largura (mm) *", min_value=100, max_value=5000, 
-                                                        value=int(chapa_edit.largura), step=50)
-                            with col3:
-                                espessura = st.number_input("Espessura (mm) *", min_value=3, max_value=50, 
-                                                          value=int(chapa_edit.espessura), step=1)
-                            
-                            col4, col5 = st.columns(2)
-                            with col4:
-                                cor = st.text_input("Cor", value=chapa_edit.cor or "")
-                                fornecedor = st.text_input("Fornecedor", value=chapa_edit.fornecedor or "")
-                            
-                            with col5:
-                                acabamento = st.text_input("Acabamento", value=chapa_edit.acabamento or "")
-                                preco = st.number_input("Preço (R$) *", min_value=0.0, max_value=10000.0, 
-                                                       value=float(chapa_edit.preco), step=10.0)
-                            
-                            observacoes = st.text_area("Observações", value=chapa_edit.observacoes or "")
-                            
-                            col_btn1, col_btn2 = st.columns(2)
-                            
-                            with col_btn1:
-                                submit = st.form_submit_button("💾 Salvar Alterações", use_container_width=True, type="primary")
-                            
-                            with col_btn2:
-                                cancel = st.form_submit_button("❌ Cancelar", use_container_width=True)
-                            
-                            if submit:
-                                if not nome:
-                                    st.error("Nome é obrigatório!")
-                                else:
-                                    chapa_edit.nome = nome
-                                    chapa_edit.comprimento = comprimento
-                                    chapa_edit.largura = largura
-                                    chapa_edit.espessura = espessura
-                                    chapa_edit.preco = preco
-                                    chapa_edit.cor = cor
-                                    chapa_edit.acabamento = acabamento
-                                    chapa_edit.fornecedor = fornecedor
-                                    chapa_edit.observacoes = observacoes
-                                    session.commit()
-                                    del st.session_state.editing_chapa
-                                    st.success("✅ Chapa atualizada com sucesso!")
-                                    st.rerun()
-                            
-                            if cancel:
-                                del st.session_state.editing_chapa
-                                st.rerun()
-            
-            # Modal de Confirmação de Exclusão
-            if 'deleting_chapa' in st.session_state and st.session_state.deleting_chapa:
-                chapa_del = session.query(TipoChapa).get(st.session_state.deleting_chapa)
-                
-                if chapa_del:
-                    st.markdown("---")
-                    st.warning(f"⚠️ Tem certeza que deseja excluir a chapa **{chapa_del.nome}**?")
-                    
-                    col_btn1, col_btn2 = st.columns(2)
-                    
-                    with col_btn1:
-                        if st.button("✅ Sim, excluir", key="confirm_del_chapa", use_container_width=True, type="primary"):
-                            chapa_del.ativo = False
-                            session.commit()
-                            del st.session_state.deleting_chapa
-                            st.success("Chapa removida!")
-                            st.rerun()
-                    
-                    with col_btn2:
-                        if st.button("❌ Cancelar", key="cancel_del_chapa", use_container_width=True):
-                            del st.session_state.deleting_chapa
-                            st.rerun()
-        else:
-            st.info("Nenhuma chapa cadastrada.")
+        with col3:
+            st.markdown("<br>", unsafe_allow_html=True)  # 👈 alinha verticalmente
+            if st.button("🗑️ Excluir", key=f"btn_del_{spec.chave}", use_container_width=True):
+                st.session_state[f'deleting_{spec.chave}_id'] = registro_id
+                st.rerun()
         
-        session.close()
-    
-    with tab2:
-        with st.form("form_chapa"):
-            st.subheader("Dados da Chapa")
-            
-            nome = st.text_input("Nome/Descrição *", placeholder="Ex: MDF Branco 15mm")
-            
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                comprimento = st.number_input("Comprimento (mm) *", min_value=100, max_value=5000, value=2750, step=50)
-            with col2:
-                largura = st.number_input("Largura (mm) *", min_value=100, max_value=5000, value=1840, step=50)
-            with col3:
-                espessura = st.number_input("Espessura (mm) *", min_value=3, max_value=50, value=15, step=1)
-            
-            col4, col5 = st.columns(2)
-            with col4:
-                cor = st.text_input("Cor", placeholder="Ex: Branco, Preto, Natural")
-                fornecedor = st.text_input("Fornecedor", placeholder="Ex: Duratex, Berneck")
-            
-            with col5:
-                acabamento = st.text_input("Acabamento", placeholder="Ex: BP, Cru, Laca")
-                preco = st.number_input("Preço (R$) *", min_value=0.0, max_value=10000.0, value=180.0, step=10.0)
-            
-            observacoes = st.text_area("Observações")
-            
-            submit = st.form_submit_button("💾 Salvar Chapa", use_container_width=True)
-            
-            if submit:
-                if not nome:
-                    st.error("Nome é obrigatório!")
-                else:
-                    session = db_manager.get_session()
-                    nova_chapa = TipoChapa(
-                        nome=nome,
-                        comprimento=comprimento,
-                        largura=largura,
-                        espessura=espessura,
-                        preco=preco,
-                        cor=cor,
-                        acabamento=acabamento,
-                        fornecedor=fornecedor,
-                        observacoes=observacoes
-                    )
-                    session.add(nova_chapa)
-                    session.commit()
-                    session.close()
-                    st.success(f"✅ Chapa '{nome}' cadastrada com sucesso!")
-                    st.rerun()
+        st.markdown("---")
+        
+        # Grid EMBAIXO
+        st.dataframe(df, use_container_width=True, hide_index=True,
+                     column_config=spec.column_config)
+    else:
+        st.info(f"Nenhuma {spec.chave} cadastrada.")
 
-# ============================================================================
-# TELA: CADASTRO DE FITAS
-# ============================================================================
 
-def tela_fitas():
-    """Tela de cadastro de tipos de fita de borda"""
-    st.title("📏 Cadastro de Tipos de Fita de Borda")
-    
-    tab1, tab2 = st.tabs(["📋 Fitas Cadastradas", "➕ Nova Fita"])
-    
-    with tab1:
-        session = db_manager.get_session()
-        fitas = session.query(TipoFita).filter_by(ativo=True).order_by(TipoFita.nome).all()
+@st.fragment
+def _aba_nova(chave):
+    """Aba do cadastro; o formulário reexecuta só este fragmento"""
+    spec = CRUD_SPECS[chave]
+    with st.form(f"form_{spec.chave}"):
+        st.subheader(f"Dados da {spec.label}")
         
-        if fitas:
-            st.subheader(f"Total: {len(fitas)} tipo(s) de fita")
-            
-            # Seleção e botões ACIMA
-            col1, col2, col3 = st.columns([4, 1, 1])
-            
-            with col1:
-                fita_id = st.selectbox(
-                    "Selecione uma fita:",
-                    options=[f.id for f in fitas],
-                    format_func=lambda x: next(f.nome for f in fitas if f.id == x),
-                    key="select_fita_list"
-                )
-            
-            with col2:
-                st.markdown("<br>", unsafe_allow_html=True)  # 👈 alinha verticalmente
-                if st.button("✏️ Editar", key="btn_edit_fita", use_container_width=True):
-                    st.session_state.editing_fita_id = fita_id
-                    st.rerun()
-            
-            with col3:
-                st.markdown("<br>", unsafe_allow_html=True)  # 👈 alinha verticalmente
-                if st.button("🗑️ Excluir", key="btn_del_fita", use_container_width=True):
-                    st.session_state.deleting_fita_id = fita_id
-                    st.rerun()
-            
-            st.markdown("---")
-            
-            # Grid EMBAIXO
-            dados_grid = []
-            for fita in fitas:
-                dados_grid.append({
-                    'ID': fita.id,
-                    'Nome': fita.nome,
-                    'Largura (mm)': int(fita.largura),
-                    'Rolo (m)': int(fita.comprimento_rolo),
-                    'Preço/Rolo': f"R$ {fita.preco_rolo:.2f}",
-                    'Cor': fita.cor or '-',
-                    'Material': fita.material or '-',
-                    'Fornecedor': fita.fornecedor or '-',
-                })
-            
-            df = pd.DataFrame(dados_grid)
-            st.dataframe(df, use_container_width=True, hide_index=True)
-        else:
-            st.info("Nenhuma fita cadastrada.")
+        valores = _campos_formulario(spec)
         
-        session.close()
-    
-    with tab2:
-        # Mostrar mensagem de sucesso se houver
-        if 'msg_sucesso_fita' in st.session_state:
-            st.success(st.session_state.msg_sucesso_fita)
-            st.balloons()
-            del st.session_state.msg_sucesso_fita
+        submit = st.form_submit_button(f"💾 Salvar {spec.label}", use_container_width=True)
         
-        with st.form("form_fita"):
-            st.subheader("Dados da Fita")
-            
-            nome = st.text_input("Nome/Descrição *", placeholder="Ex: Fita Branca 22mm")
-            
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                largura = st.number_input("Largura (mm) *", min_value=10, max_value=100, value=22, step=1)
-            with col2:
-                comprimento_rolo = st.number_input("Comprimento/rolo (m) *", min_value=10, max_value=200, value=50, step=10)
-            with col3:
-                preco_rolo = st.number_input("Preço/rolo (R$) *", min_value=0.0, max_value=1000.0, value=25.0, step=5.0)
-            
-            col4, col5 = st.columns(2)
-            with col4:
-                cor = st.text_input("Cor", placeholder="Ex: Branco, Preto, Amadeirado")
-                fornecedor = st.text_input("Fornecedor")
-            
-            with col5:
-                material = st.text_input("Material", placeholder="Ex: PVC, ABS, Melamínico")
-            
-            observacoes = st.text_area("Observações")
-            
-            submit = st.form_submit_button("💾 Salvar Fita", use_container_width=True)
-            
-            if submit:
-                if not nome:
-                    st.error("❌ Nome é obrigatório!")
-                else:
-                    session = db_manager.get_session()
-                    nova_fita = TipoFita(
-                        nome=nome,
-                        largura=largura,
-                        comprimento_rolo=comprimento_rolo,
-                        preco_rolo=preco_rolo,
-                        cor=cor,
-                        material=material,
-                        fornecedor=fornecedor,
-                        observacoes=observacoes
-                    )
-                    session.add(nova_fita)
-                    session.commit()
-                    session.close()
-                    st.session_state.msg_sucesso_fita = f"✅ Fita '{nome}' cadastrada com sucesso!"
-                    st.rerun()
-    
-    # Modals
-    if 'editing_fita_id' in st.session_state:
-        modal_editar_fita()
-    
-    if 'deleting_fita_id' in st.session_state:
-        modal_excluir_fita()
+        if submit:
+            if not valores['nome']:
+                st.error("❌ Nome é obrigatório!")
+            else:
+                with SessionLocal() as session:
+                    _insert_registros(session, spec.model, [valores])
+                _limpar_caches_cadastro()
+                st.toast(f"{spec.label} '{valores['nome']}' cadastrada com sucesso!", icon="✅")
+                st.rerun()
 
 
-@st.dialog("✏️ Editar Fita")
-def modal_editar_fita():
-    """Modal para editar fita"""
-    session = db_manager.get_session()
-    fita = session.query(TipoFita).get(st.session_state.editing_fita_id)
+def _modal_editar(spec):
+    """Modal para editar o registro em `editing_<chave>_id`"""
+    chave_id, chave_defaults = f'editing_{spec.chave}_id', f'edit_{spec.chave}_defaults'
+    registro_id = st.session_state[chave_id]
+    registro = st.session_state.get(chave_defaults)
     
-    if fita:
-        with st.form("form_edit_fita"):
-            nome = st.text_input("Nome/Descrição *", value=fita.nome)
-            
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                largura = st.number_input("Largura (mm) *", min_value=10, max_value=100, 
-                                        value=int(fita.largura), step=1)
-            with col2:
-                comprimento_rolo = st.number_input("Comprimento/rolo (m) *", min_value=10, max_value=200, 
-                                                  value=int(fita.comprimento_rolo), step=10)
-            with col3:
-                preco_rolo = st.number_input("Preço/rolo (R$) *", min_value=0.0, max_value=1000.0, 
-                                            value=float(fita.preco_rolo), step=5.0)
-            
-            col4, col5 = st.columns(2)
-            with col4:
-                cor = st.text_input("Cor", value=fita.cor or "")
-                fornecedor = st.text_input("Fornecedor", value=fita.fornecedor or "")
-            
-            with col5:
-                material = st.text_input("Material", value=fita.material or "")
-            
-            observacoes = st.text_area("Observações", value=fita.observacoes or "")
+    if registro:
+        with st.form(f"form_edit_{spec.chave}"):
+            fields = _campos_formulario(spec, registro)
             
             col_btn1, col_btn2 = st.columns(2)
             
@@ -834,146 +630,140 @@ def modal_editar_fita():
                 cancel = st.form_submit_button("❌ Cancelar", use_container_width=True)
             
             if submit:
-                if not nome:
+                if not fields['nome']:
                     st.error("❌ Nome é obrigatório!")
                 else:
-                    fita.nome = nome
-                    fita.largura = largura
-                    fita.comprimento_rolo = comprimento_rolo
-                    fita.preco_rolo = preco_rolo
-                    fita.cor = cor
-                    fita.material = material
-                    fita.fornecedor = fornecedor
-                    fita.observacoes = observacoes
-                    session.commit()
-                    session.close()
-                    del st.session_state.editing_fita_id
-                    st.success("✅ Fita atualizada com sucesso!")
+                    with SessionLocal() as session:
+                        session.execute(
+                            update(spec.model).where(spec.model.id == registro_id).values(**fields)
+                        )
+                        session.commit()
+                    _limpar_caches_cadastro()
+                    del st.session_state[chave_id], st.session_state[chave_defaults]
+                    st.success(f"✅ {spec.label} atualizada com sucesso!")
                     st.rerun()
             
             if cancel:
-                session.close()
-                del st.session_state.editing_fita_id
+                del st.session_state[chave_id], st.session_state[chave_defaults]
                 st.rerun()
-    else:
-        session.close()
 
 
-@st.dialog("🗑️ Excluir Fita")
-def modal_excluir_fita():
-    """Modal para confirmar exclusão de fita"""
-    session = db_manager.get_session()
-    fita = session.query(TipoFita).get(st.session_state.deleting_fita_id)
-    
-    if fita:
-        st.warning(f"⚠️ Tem certeza que deseja excluir a fita **{fita.nome}**?")
+def _modal_excluir(spec):
+    """Modal para confirmar a exclusão (lógica) do registro em `deleting_<chave>_id`"""
+    chave_id = f'deleting_{spec.chave}_id'
+    registro_id = st.session_state[chave_id]
+    with SessionLocal() as session:
+        nome = session.execute(
+            select(spec.model.nome).where(spec.model.id == registro_id)
+        ).scalar_one_or_none()
+    
+    if nome is not None:
+        st.warning(f"⚠️ Tem certeza que deseja excluir a {spec.chave} **{nome}**?")
         st.write("Esta ação não pode ser desfeita.")
         
         col1, col2 = st.columns(2)
         
         with col1:
-            if st.button("✅ Sim, excluir", key="confirm_del_fita", use_container_width=True, type="primary"):
-                fita.ativo = False
-                session.commit()
-                session.close()
-                del st.session_state.deleting_fita_id
-                st.success("✅ Fita excluída com sucesso!")
+            if st.button("✅ Sim, excluir", key=f"confirm_del_{spec.chave}", use_container_width=True, type="primary"):
+                with SessionLocal() as session:
+                    session.execute(
+                        update(spec.model).where(spec.model.id == registro_id).values(ativo=False)
+                    )
+                    session.commit()
+                _limpar_caches_cadastro()
+                del st.session_state[chave_id]
+                st.success(f"✅ {spec.label} excluída com sucesso!")
                 st.rerun()
         
         with col2:
-            if st.button("❌ Cancelar", key="cancel_del_fita", use_container_width=True):
-                session.close()
-                del st.session_state.deleting_fita_id
+            if st.button("❌ Cancelar", key=f"cancel_del_{spec.chave}", use_container_width=True):
+                del st.session_state[chave_id]
                 st.rerun()
-    else:
-        session.close()
 
-# ============================================================================
-# TELA: OTIMIZADOR (COMPLETO E INTEGRADO)
-# ============================================================================
 
-def tela_otimizador():
-    """Tela principal de otimização integrada com cadastros"""
-    st.title("🎯 SMART - Otimizador de Cortes Profissional")
-    
-    # Verificar se há chapas e fitas cadastradas
-    session = db_manager.get_session()
-    chapas_disponiveis = session.query(TipoChapa).filter_by(ativo=True).all()
-    fitas_disponiveis = session.query(TipoFita).filter_by(ativo=True).all()
-    clientes_disponiveis = session.query(Cliente).all()
-    session.close()
-    
-    if not chapas_disponiveis:
-        st.error("⚠️ Nenhum tipo de chapa cadastrado! Cadastre chapas antes de usar o otimizador.")
-        if st.button("📦 Ir para Cadastro de Chapas"):
-            st.session_state.menu_atual = 'Chapas'
-            st.rerun()
-        return
-    
-    # ====================================================================
-    # SIDEBAR - CONFIGURAÇÕES DO PROJETO
-    # ====================================================================
-    
-    with st.sidebar:
-        st.header("⚙️ Configurações do Projeto")
-        
-        # Seleção de cliente
-        if clientes_disponiveis:
-            opcoes_clientes = {f"{c.nome}": c.id for c in clientes_disponiveis}
-            opcoes_clientes["[Sem Cliente]"] = None
-            
-            cliente_selecionado = st.selectbox(
-                "Cliente",
-                options=list(opcoes_clientes.keys()),
-                index=0
-            )
-            cliente_id = opcoes_clientes[cliente_selecionado]
-        else:
-            st.info("Nenhum cliente cadastrado")
-            cliente_id = None
-        
-        nome_projeto = st.text_input("Nome do Projeto", placeholder="Ex: Armário Cozinha")
-        
-        st.divider()
-        
-        st.header("🔧 Parâmetros Gerais")
-        
-        kerf = st.number_input(
-            "Espessura do corte - Kerf (mm)",
-            min_value=1.0,
-            max_value=10.0,
-            value=3.0,
-            step=0.5,
-            help="Largura da lâmina da serra"
-        )
-        
-        sentido_veio = st.selectbox(
-            "Sentido do veio da chapa",
-            options=["Horizontal (no comprimento)", "Vertical (na largura)", "Sem veio (MDF)"],
-            index=0,
-            help="Define a direção das fibras/veio na chapa"
-        )
-        
-        st.divider()
-        st.caption("💡 Configure o projeto e adicione peças")
+def render_crud(spec):
+    """Tela de cadastro descrita por uma CrudSpec"""
+    st.title(spec.titulo)
     
-    # ====================================================================
-    # ÁREA PRINCIPAL - CADASTRO DE PEÇAS
-    # ====================================================================
+    tab1, tab2 = st.tabs([f"📋 {spec.label}s Cadastradas", f"➕ Nova {spec.label}"])
     
-    # Inicializar session state para peças
-    if 'pecas_otimizador' not in st.session_state:
-        st.session_state.pecas_otimizador = []
+    with tab1:
+        _aba_lista(spec.chave)
     
-    # Inicializar valores padrão para manter seleções
-    if 'ultima_chapa_id' not in st.session_state:
-        st.session_state.ultima_chapa_id = chapas_disponiveis[0].id if chapas_disponiveis else None
-    if 'ultima_fita_id' not in st.session_state:
-        st.session_state.ultima_fita_id = None
+    with tab2:
+        _aba_nova(spec.chave)
     
-    st.header("📋 Cadastro de Peças do Projeto")
+    # Modals
+    if f'editing_{spec.chave}_id' in st.session_state:
+        st.dialog(f"✏️ Editar {spec.label}", width="large")(_modal_editar)(spec)
     
-    # Formulário de cadastro
+    if f'deleting_{spec.chave}_id' in st.session_state:
+        st.dialog(f"🗑️ Excluir {spec.label}")(_modal_excluir)(spec)
+
+
+def tela_chapas():
+    """Tela de cadastro de tipos de chapa"""
+    render_crud(CRUD_SPECS['chapa'])
+
+
+def tela_fitas():
+    """Tela de cadastro de tipos de fita de borda"""
+    render_crud(CRUD_SPECS['fita'])
+
+
+# ============================================================================
+# TELA: OTIMIZADOR (COMPLETO E INTEGRADO)
+# ============================================================================
+
+@st.cache_data(ttl=60)
+def _load_chapas_ativas():
+    """Chapas ativas para o otimizador: {id: dados usados na tela}"""
+    with SessionLocal() as session:
+        return {
+            c.id: {
+                'nome': c.nome,
+                'comprimento': c.comprimento,
+                'largura': c.largura,
+                'espessura': c.espessura,
+                'preco': c.preco,
+                'descricao': c.descricao_completa(),
+            }
+            for c in session.scalars(select(TipoChapa).where(TipoChapa.ativo == True))
+        }
+
+
+@st.cache_data(ttl=60)
+def _load_fitas_ativas():
+    """Fitas ativas para o otimizador: {id: dados usados na tela}"""
+    with SessionLocal() as session:
+        return {
+            f.id: {
+                'nome': f.nome,
+                'comprimento_rolo': f.comprimento_rolo,
+                'preco_rolo': f.preco_rolo,
+                'descricao': f.descricao_completa(),
+            }
+            for f in session.scalars(select(TipoFita).where(TipoFita.ativo == True))
+        }
+
+
+def _opcoes_sessao(tabela, disponiveis, inicio=None):
+    """Opções {descrição: id} de um selectbox, guardadas na sessão até o cadastro mudar
+    (ids ou descrições, venha a edição desta ou de outra sessão)"""
+    assinatura = tuple((id_, d['descricao']) for id_, d in disponiveis.items())
+    chave = f'_opcoes_{tabela}'
+    salvo = st.session_state.get(chave)
+    if salvo is None or salvo[0] != assinatura:
+        opcoes = dict(inicio or {})
+        opcoes.update((d['descricao'], id_) for id_, d in disponiveis.items())
+        salvo = (assinatura, opcoes)
+        st.session_state[chave] = salvo
+    return salvo[1]
+
+
+@st.fragment
+def _form_peca(chapas_disponiveis, fitas_disponiveis):
+    """Formulário de cadastro de peças; a validação reexecuta só este fragmento"""
     with st.form("form_peca_otimizador", clear_on_submit=True):
         col1, col2, col3, col4 = st.columns([3, 2, 2, 1])
         
@@ -991,15 +781,13 @@ def tela_otimizador():
         
         # Seleção de tipo de chapa - Manter última seleção
         st.markdown("##### 📦 Tipo de Chapa")
-        opcoes_chapas = {c.descricao_completa(): c.id for c in chapas_disponiveis}
+        opcoes_chapas = _opcoes_sessao('chapas', chapas_disponiveis)
         
         # Encontrar índice da última chapa selecionada
         lista_chapas = list(opcoes_chapas.keys())
-        indice_chapa = 0
-        for i, (desc, chapa_id) in enumerate(opcoes_chapas.items()):
-            if chapa_id == st.session_state.ultima_chapa_id:
-                indice_chapa = i
-                break
+        indice_chapa = next(
+            (i for i, chapa_id in enumerate(opcoes_chapas.values()) if chapa_id == st.session_state.ultima_chapa_id), 0
+        )
         
         chapa_selecionada = st.selectbox(
             "Selecione o tipo de chapa para esta peça",
@@ -1016,17 +804,13 @@ def tela_otimizador():
         
         if fitas_disponiveis:
             # Adicionar opção "Sem fita"
-            opcoes_fitas = {"[Sem Fita de Borda]": None}
-            for f in fitas_disponiveis:
-                opcoes_fitas[f.descricao_completa()] = f.id
+            opcoes_fitas = _opcoes_sessao('fitas', fitas_disponiveis, {"[Sem Fita de Borda]": None})
             
             # Encontrar índice da última fita selecionada
             lista_fitas = list(opcoes_fitas.keys())
-            indice_fita = 0
-            for i, (desc, fita_id) in enumerate(opcoes_fitas.items()):
-                if fita_id == st.session_state.ultima_fita_id:
-                    indice_fita = i
-                    break
+            indice_fita = next(
+                (i for i, fita_id in enumerate(opcoes_fitas.values()) if fita_id == st.session_state.ultima_fita_id), 0
+            )
             
             fita_selecionada = st.selectbox(
                 "Tipo de fita (deixe em 'Sem Fita' se não usar)",
@@ -1095,110 +879,194 @@ def tela_otimizador():
                 
                 st.success(f"✅ Peça '{nome_peca}' adicionada!")
                 st.rerun()
+
+
+@st.fragment
+def _grupo_pecas(chapa_id, tipo_chapa, pecas_com_idx, fitas_map):
+    """Peças de um tipo de chapa; o seletor de peça reexecuta só este fragmento"""
+    with st.expander(f"📦 {tipo_chapa.nome} - {len(pecas_com_idx)} peça(s)", expanded=True):
+        # Criar DataFrame
+        dados_tabela = []
+        indices_pecas = []
+        
+        for idx, p in pecas_com_idx:
+            indices_pecas.append(idx)
+            
+            # Buscar tipo de fita se houver
+            tipo_fita_nome = "-"
+            if p['tipo_fita_id']:
+                tipo_fita = fitas_map.get(p['tipo_fita_id'])
+                tipo_fita_nome = tipo_fita.nome if tipo_fita else "-"
+            
+            # Formatar fitas
+            fitas_str = engine.Peca.bordas_str(
+                p['fita_borda_comp1'], p['fita_borda_comp2'],
+                p['fita_borda_larg1'], p['fita_borda_larg2']
+            )
+            
+            dados_tabela.append({
+                'Nome': p['nome'],
+                'Comp. (mm)': int(p['comprimento']),
+                'Larg. (mm)': int(p['largura']),
+                'Qtd': p['quantidade'],
+                'Tipo Chapa': tipo_chapa.nome,
+                'Tipo Fita': tipo_fita_nome,
+                'Bordas': fitas_str,
+                'Veio': '🌾' if p['respeitar_veio'] else '-'
+            })
+        
+        df = pd.DataFrame(dados_tabela)
+        # A própria tabela (virtualizada) é o seletor: sem um selectbox com todas as peças
+        selecao = st.dataframe(
+            df, use_container_width=True, hide_index=True,
+            on_select='rerun', selection_mode='single-row', key=f"sel_peca_{chapa_id}"
+        )
+        linhas = selecao.selection.rows
+        idx_selecionado = indices_pecas[linhas[0]] if linhas else None
+        
+        # Seleção e botões para excluir
+        st.markdown("---")
+        col_sel, col_btn1, col_btn2 = st.columns([4, 1, 1])
+        
+        with col_sel:
+            if idx_selecionado is None:
+                st.caption("Clique numa linha da tabela para selecionar uma peça.")
+            else:
+                p = st.session_state.pecas_otimizador[idx_selecionado]
+                st.markdown(f"**Selecionada:** {p['nome']} ({int(p['comprimento'])}×{int(p['largura'])}mm) - Qtd: {p['quantidade']}")
+        
+        with col_btn1:
+            if st.button("🗑️ Excluir", key=f"excluir_peca_{chapa_id}", use_container_width=True,
+                         disabled=idx_selecionado is None):
+                # Remover peça selecionada (e a seleção, que apontaria para outra linha)
+                st.session_state.pecas_otimizador.pop(idx_selecionado)
+                del st.session_state[f"sel_peca_{chapa_id}"]
+                st.success("✅ Peça excluída!")
+                st.rerun()
+        
+        with col_btn2:
+            if st.button("🗑️ Grupo", key=f"limpar_grupo_{chapa_id}", use_container_width=True):
+                # Remover todas do grupo
+                st.session_state.pecas_otimizador = [
+                    p for i, p in enumerate(st.session_state.pecas_otimizador) 
+                    if i not in indices_pecas
+                ]
+                st.success("✅ Grupo excluído!")
+                st.rerun()
+
+
+def tela_otimizador():
+    """Tela principal de otimização integrada com cadastros"""
+    st.title("🎯 SMART - Otimizador de Cortes Profissional")
+    
+    # Verificar se há chapas e fitas cadastradas (listas em cache entre reruns)
+    chapas_disponiveis = _load_chapas_ativas()
+    fitas_disponiveis = _load_fitas_ativas()
+    clientes_disponiveis = listar_clientes()
+    
+    if not chapas_disponiveis:
+        st.error("⚠️ Nenhum tipo de chapa cadastrado! Cadastre chapas antes de usar o otimizador.")
+        if st.button("📦 Ir para Cadastro de Chapas"):
+            st.session_state.menu_atual = 'Chapas'
+            st.rerun()
+        return
     
     # ====================================================================
-    # EXIBIR PEÇAS CADASTRADAS
+    # SIDEBAR - CONFIGURAÇÕES DO PROJETO
     # ====================================================================
     
-    if st.session_state.pecas_otimizador:
-        st.subheader("📦 Peças do Projeto")
-        
-        # Agrupar por tipo de chapa
-        session = db_manager.get_session()
-        pecas_por_chapa = {}
-        
-        for idx, peca in enumerate(st.session_state.pecas_otimizador):
-            chapa_id = peca['tipo_chapa_id']
-            if chapa_id not in pecas_por_chapa:
-                tipo_chapa = session.query(TipoChapa).get(chapa_id)
-                pecas_por_chapa[chapa_id] = {
-                    'tipo': tipo_chapa,
-                    'pecas': []
-                }
-            pecas_por_chapa[chapa_id]['pecas'].append((idx, peca))  # Guardar índice original
+    with st.sidebar:
+        st.header("⚙️ Configurações do Projeto")
         
-        # Exibir por grupo
-        for chapa_id, grupo in pecas_por_chapa.items():
-            tipo_chapa = grupo['tipo']
-            pecas_com_idx = grupo['pecas']
+        # Seleção de cliente
+        if clientes_disponiveis:
+            opcoes_clientes = {nome: cid for cid, nome, *_ in clientes_disponiveis}
+            opcoes_clientes["[Sem Cliente]"] = None
             
-            with st.expander(f"📦 {tipo_chapa.nome} - {len(pecas_com_idx)} peça(s)", expanded=True):
-                # Criar DataFrame
-                dados_tabela = []
-                indices_pecas = []
-                
-                for idx, p in pecas_com_idx:
-                    indices_pecas.append(idx)
-                    
-                    # Buscar tipo de fita se houver
-                    tipo_fita_nome = "-"
-                    if p['tipo_fita_id']:
-                        tipo_fita = session.query(TipoFita).get(p['tipo_fita_id'])
-                        tipo_fita_nome = tipo_fita.nome if tipo_fita else "-"
-                    
-                    # Formatar fitas
-                    bordas = []
-                    if p['fita_borda_comp1']:
-                        bordas.append("▲")
-                    if p['fita_borda_comp2']:
-                        bordas.append("▼")
-                    if p['fita_borda_larg1']:
-                        bordas.append("◀")
-                    if p['fita_borda_larg2']:
-                        bordas.append("▶")
-                    fitas_str = " ".join(bordas) if bordas else "-"
-                    
-                    dados_tabela.append({
-                        'Nome': p['nome'],
-                        'Comp. (mm)': int(p['comprimento']),
-                        'Larg. (mm)': int(p['largura']),
-                        'Qtd': p['quantidade'],
-                        'Tipo Chapa': tipo_chapa.nome,
-                        'Tipo Fita': tipo_fita_nome,
-                        'Bordas': fitas_str,
-                        'Veio': '🌾' if p['respeitar_veio'] else '-'
-                    })
-                
-                df = pd.DataFrame(dados_tabela)
-                st.dataframe(df, use_container_width=True, hide_index=True)
-                
-                # Seletor e botões para excluir
-                st.markdown("---")
-                col_sel, col_btn1, col_btn2 = st.columns([4, 1, 1])
-                
-                with col_sel:
-                    # Criar opções de seleção
-                    opcoes_pecas = {}
-                    for i, (idx, p) in enumerate(pecas_com_idx):
-                        label = f"{p['nome']} ({int(p['comprimento'])}×{int(p['largura'])}mm) - Qtd: {p['quantidade']}"
-                        opcoes_pecas[label] = idx
-                    
-                    if opcoes_pecas:
-                        peca_selecionada = st.selectbox(
-                            "Selecione uma peça:",
-                            options=list(opcoes_pecas.keys()),
-                            key=f"select_peca_{chapa_id}"
-                        )
-                        idx_selecionado = opcoes_pecas[peca_selecionada]
-                
-                with col_btn1:
-                    if st.button("🗑️ Excluir", key=f"excluir_peca_{chapa_id}", use_container_width=True):
-                        # Remover peça selecionada
-                        st.session_state.pecas_otimizador.pop(idx_selecionado)
-                        st.success("✅ Peça excluída!")
-                        st.rerun()
-                
-                with col_btn2:
-                    if st.button("🗑️ Grupo", key=f"limpar_grupo_{chapa_id}", use_container_width=True):
-                        # Remover todas do grupo
-                        st.session_state.pecas_otimizador = [
-                            p for i, p in enumerate(st.session_state.pecas_otimizador) 
-                            if i not in indices_pecas
-                        ]
-                        st.success("✅ Grupo excluído!")
-                        st.rerun()
+            cliente_selecionado = st.selectbox(
+                "Cliente",
+                options=list(opcoes_clientes.keys()),
+                index=0
+            )
+            cliente_id = opcoes_clientes[cliente_selecionado]
+        else:
+            st.info("Nenhum cliente cadastrado")
+            cliente_id = None
+        
+        nome_projeto = st.text_input("Nome do Projeto", placeholder="Ex: Armário Cozinha")
+        
+        st.divider()
+        
+        st.header("🔧 Parâmetros Gerais")
+        
+        kerf = st.number_input(
+            "Espessura do corte - Kerf (mm)",
+            min_value=1.0,
+            max_value=10.0,
+            value=3.0,
+            step=0.5,
+            help="Largura da lâmina da serra"
+        )
+        
+        sentido_veio = st.selectbox(
+            "Sentido do veio da chapa",
+            options=["Horizontal (no comprimento)", "Vertical (na largura)", "Sem veio (MDF)"],
+            index=0,
+            help="Define a direção das fibras/veio na chapa"
+        )
+        
+        st.divider()
+        st.caption("💡 Configure o projeto e adicione peças")
+    
+    # ====================================================================
+    # ÁREA PRINCIPAL - CADASTRO DE PEÇAS
+    # ====================================================================
+    
+    # Inicializar session state para peças
+    if 'pecas_otimizador' not in st.session_state:
+        st.session_state.pecas_otimizador = []
+    
+    # Inicializar valores padrão para manter seleções
+    if 'ultima_chapa_id' not in st.session_state:
+        st.session_state.ultima_chapa_id = next(iter(chapas_disponiveis), None)
+    if 'ultima_fita_id' not in st.session_state:
+        st.session_state.ultima_fita_id = None
+    
+    st.header("📋 Cadastro de Peças do Projeto")
+    
+    # Formulário de cadastro
+    _form_peca(chapas_disponiveis, fitas_disponiveis)
+    
+    # ====================================================================
+    # EXIBIR PEÇAS CADASTRADAS
+    # ====================================================================
+    
+    if st.session_state.pecas_otimizador:
+        st.subheader("📦 Peças do Projeto")
         
-        session.close()
+        # Tipos de chapa/fita das peças numa consulta IN cada, não uma por peça
+        pecas = st.session_state.pecas_otimizador
+        chapa_ids = {p['tipo_chapa_id'] for p in pecas}
+        fita_ids = {p['tipo_fita_id'] for p in pecas if p['tipo_fita_id']}
+        with SessionLocal() as session:
+            chapas_map = {c.id: c for c in session.scalars(select(TipoChapa).where(TipoChapa.id.in_(chapa_ids)))}
+            fitas_map = {f.id: f for f in session.scalars(select(TipoFita).where(TipoFita.id.in_(fita_ids)))}
+        
+        # Agrupar por tipo de chapa
+        pecas_por_chapa = defaultdict(lambda: {'tipo': None, 'pecas': []})
+        
+        for idx, peca in enumerate(pecas):
+            pecas_por_chapa[peca['tipo_chapa_id']]['pecas'].append((idx, peca))  # Guardar índice original
+        
+        for chapa_id, grupo in pecas_por_chapa.items():
+            grupo['tipo'] = chapas_map[chapa_id]
+        
+        # Exibir por grupo
+        for chapa_id, grupo in pecas_por_chapa.items():
+            tipo_chapa = grupo['tipo']
+            pecas_com_idx = grupo['pecas']
+            
+            _grupo_pecas(chapa_id, tipo_chapa, pecas_com_idx, fitas_map)
         
         # Botões de ação
         st.divider()
@@ -1220,25 +1088,40 @@ def tela_otimizador():
         st.divider()
         
         if st.button("🎯 GERAR PLANO DE CORTE OTIMIZADO", type="primary", use_container_width=True):
-            with st.spinner("🔄 Otimizando cortes por tipo de material..."):
-                # Processar otimização por tipo de chapa
-                resultados_por_tipo = processar_otimizacao_por_tipo(
-                    st.session_state.pecas_otimizador,
-                    kerf,
-                    sentido_veio
-                )
-                
-                # Armazenar resultados
-                st.session_state.resultados_otimizacao = resultados_por_tipo
-                st.session_state.config_projeto = {
-                    'nome': nome_projeto,
-                    'cliente_id': cliente_id,
-                    'kerf': kerf,
-                    'sentido_veio': sentido_veio
-                }
-                
-                st.success(f"✅ Otimização concluída! {len(resultados_por_tipo)} tipo(s) de material.")
-                st.rerun()
+            config_projeto = {
+                'nome': nome_projeto,
+                'cliente_id': cliente_id,
+                'kerf': kerf,
+                'sentido_veio': sentido_veio
+            }
+            
+            # Assinatura do que decide o resultado: peças, parâmetros e cadastros
+            assinatura = hashlib.blake2b(repr((
+                tuple(tuple(p[campo] for campo in CAMPOS_PECA) for p in st.session_state.pecas_otimizador),
+                kerf, sentido_veio, chapas_disponiveis, fitas_disponiveis
+            )).encode(), digest_size=16).digest()
+            
+            if st.session_state.get('_opt_hash') == assinatura and st.session_state.get('resultados_otimizacao'):
+                # Nada mudou (ex.: só o nome do projeto ou o cliente): mantém o resultado
+                st.session_state.config_projeto = config_projeto
+                st.toast("Nada mudou nas peças ou parâmetros; resultado mantido.", icon="♻️")
+            else:
+                with st.spinner("🔄 Otimizando cortes por tipo de material..."):
+                    # Processar otimização por tipo de chapa
+                    resultados_por_tipo = processar_otimizacao_por_tipo(
+                        st.session_state.pecas_otimizador,
+                        kerf,
+                        sentido_veio
+                    )
+                    
+                    # Armazenar resultados
+                    st.session_state.resultados_otimizacao = resultados_por_tipo
+                    st.session_state.resumo = resumir_resultados(resultados_por_tipo)
+                    st.session_state.config_projeto = config_projeto
+                    st.session_state._opt_hash = assinatura
+                    
+                    st.success(f"✅ Otimização concluída! {len(resultados_por_tipo)} tipo(s) de material.")
+                    st.rerun()
     
     else:
         st.info("👆 Adicione peças ao projeto usando o formulário acima.")
@@ -1251,48 +1134,58 @@ def tela_otimizador():
         exibir_resultados_otimizacao()
 
 
-def processar_otimizacao_por_tipo(pecas_data, kerf, sentido_veio):
-    """Processa otimização separada por tipo de chapa"""
-    session = db_manager.get_session()
-    
-    # Agrupar peças por tipo de chapa
+# Campos de cada peça do otimizador que determinam o resultado
+CAMPOS_PECA = (
+    'nome', 'comprimento', 'largura', 'quantidade', 'tipo_chapa_id', 'tipo_fita_id',
+    'fita_borda_comp1', 'fita_borda_comp2', 'fita_borda_larg1', 'fita_borda_larg2',
+    'respeitar_veio'
+)
+# ...e os que viram argumentos de engine.Peca
+CAMPOS_PECA_ENGINE = tuple(c for c in CAMPOS_PECA if c not in ('tipo_chapa_id', 'tipo_fita_id'))
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _otimizar(pecas_tuple, chapas_dims, kerf, sentido_veio):
+    """Parte pesada da otimização, memoizada pela assinatura das peças.
+    
+    `pecas_tuple` tem uma tupla por peça na ordem de CAMPOS_PECA e `chapas_dims`
+    as medidas (id, comprimento, largura, espessura) dos tipos de chapa, para que
+    editar uma chapa também mude a chave. Devolve, por tipo de chapa, as chapas
+    otimizadas e o total de fita (mm) por tipo de fita.
+    """
+    dims = {cid: (comp, larg, esp) for cid, comp, larg, esp in chapas_dims}
+    
+    # Agrupar peças por tipo de chapa. O engine já expande cada Peca pela
+    # quantidade, então vai uma por linha do projeto, sem duplicar aqui; e
+    # já ordena por área decrescente (FFD), então a ordem de entrada não importa
     pecas_por_tipo = {}
     
-    for peca_data in pecas_data:
-        tipo_chapa_id = peca_data['tipo_chapa_id']
-        
-        if tipo_chapa_id not in pecas_por_tipo:
-            pecas_por_tipo[tipo_chapa_id] = []
-        
-        # Converter para objeto Peca do engine
-        for _ in range(peca_data['quantidade']):
-            peca_obj = engine.Peca(
-                nome=peca_data['nome'],
-                comprimento=peca_data['comprimento'],
-                largura=peca_data['largura'],
-                quantidade=1,  # Já expandido
-                fita_borda_comp1=peca_data['fita_borda_comp1'],
-                fita_borda_comp2=peca_data['fita_borda_comp2'],
-                fita_borda_larg1=peca_data['fita_borda_larg1'],
-                fita_borda_larg2=peca_data['fita_borda_larg2'],
-                respeitar_veio=peca_data['respeitar_veio']
-            )
-            pecas_por_tipo[tipo_chapa_id].append((peca_obj, peca_data['tipo_fita_id']))
+    for valores in pecas_tuple:
+        peca_data = dict(zip(CAMPOS_PECA, valores))
+        pecas_por_tipo.setdefault(peca_data['tipo_chapa_id'], []).append(
+            engine.Peca(**{k: peca_data[k] for k in CAMPOS_PECA_ENGINE})
+        )
+    
+    # Total de fita (mm) por (tipo de chapa, tipo de fita) numa só redução,
+    # já multiplicado pela quantidade; peças sem fita ficam de fora
+    df = pd.DataFrame(pecas_tuple, columns=CAMPOS_PECA)
+    df = df[df['tipo_fita_id'].notna() & (df['tipo_fita_id'] != 0)]
+    fita_mm = df.assign(fita_mm=(
+        (df['fita_borda_comp1'].astype(int) + df['fita_borda_comp2'].astype(int)) * df['comprimento']
+        + (df['fita_borda_larg1'].astype(int) + df['fita_borda_larg2'].astype(int)) * df['largura']
+    ) * df['quantidade']).groupby(['tipo_chapa_id', 'tipo_fita_id'])['fita_mm'].sum()
     
     # Otimizar cada tipo separadamente
     resultados = {}
     
-    for tipo_chapa_id, pecas_com_fita in pecas_por_tipo.items():
-        tipo_chapa = session.query(TipoChapa).get(tipo_chapa_id)
-        
-        # Extrair apenas objetos Peca
-        pecas_lista = [p[0] for p in pecas_com_fita]
+    for tipo_chapa_id, pecas_lista in pecas_por_tipo.items():
+        comprimento, largura, espessura = dims[tipo_chapa_id]
         
         # Criar otimizador
         otimizador = engine.OtimizadorCortes(
-            comprimento_chapa=tipo_chapa.comprimento,
-            largura_chapa=tipo_chapa.largura,
-            espessura=tipo_chapa.espessura,
+            comprimento_chapa=comprimento,
+            largura_chapa=largura,
+            espessura=espessura,
             kerf=kerf,
             sentido_veio=sentido_veio
         )
@@ -1300,165 +1193,183 @@ def processar_otimizacao_por_tipo(pecas_data, kerf, sentido_veio):
         # Otimizar
         chapas = otimizador.otimizar(pecas_lista)
         
-        # Calcular custos de fita por tipo
-        custos_fita_por_tipo = {}
-        total_fita_por_tipo = {}
-        
-        for peca_obj, tipo_fita_id in pecas_com_fita:
-            if tipo_fita_id:
-                fita_mm = peca_obj.comprimento_fita()
-                if tipo_fita_id not in total_fita_por_tipo:
-                    total_fita_por_tipo[tipo_fita_id] = 0
-                total_fita_por_tipo[tipo_fita_id] += fita_mm
-        
-        # Calcular custos de fita
-        for tipo_fita_id, total_mm in total_fita_por_tipo.items():
-            tipo_fita = session.query(TipoFita).get(tipo_fita_id)
-            total_m = total_mm / 1000
-            rolos = -(-total_m // tipo_fita.comprimento_rolo)  # Arredonda para cima
-            custo = rolos * tipo_fita.preco_rolo
-            
-            custos_fita_por_tipo[tipo_fita_id] = {
-                'tipo_fita': tipo_fita,
-                'total_metros': total_m,
-                'rolos': int(rolos),
-                'custo': custo
-            }
+        # Total de fita por tipo
+        total_fita_por_tipo = {
+            int(tipo_fita_id): float(mm)
+            for (tc_id, tipo_fita_id), mm in fita_mm.items()
+            if tc_id == tipo_chapa_id
+        }
         
         resultados[tipo_chapa_id] = {
-            'tipo_chapa': tipo_chapa,
             'chapas': chapas,
-            'custos_fita': custos_fita_por_tipo
+            'fita_mm': total_fita_por_tipo
         }
     
-    session.close()
     return resultados
 
 
-def exibir_resultados_otimizacao():
-    """Exibe os resultados da otimização"""
-    st.header("📊 Resultados da Otimização")
-    
-    resultados = st.session_state.resultados_otimizacao
-    
-    # Calcular totais gerais
-    total_chapas_geral = sum(len(r['chapas']) for r in resultados.values())
-    custo_total_chapas = sum(
-        len(r['chapas']) * r['tipo_chapa'].preco 
-        for r in resultados.values()
-    )
-    custo_total_fitas = sum(
-        sum(cf['custo'] for cf in r['custos_fita'].values())
-        for r in resultados.values()
+@dataclass(frozen=True)
+class TipoChapaInfo:
+    """Campos do TipoChapa usados pela otimização, sem sessão aberta por trás"""
+    id: int
+    nome: str
+    comprimento: float
+    largura: float
+    espessura: float
+    preco: float
+
+
+@dataclass(frozen=True)
+class TipoFitaInfo:
+    """Campos do TipoFita usados no custo das fitas"""
+    id: int
+    nome: str
+    comprimento_rolo: float
+    preco_rolo: float
+
+
+def processar_otimizacao_por_tipo(pecas_data, kerf, sentido_veio):
+    """Processa otimização separada por tipo de chapa"""
+    # Todos os tipos de chapa e fita envolvidos numa consulta IN cada; a sessão
+    # fecha antes da otimização, que só usa os valores copiados
+    with db_manager.get_session() as session:
+        chapas_map = {r.id: TipoChapaInfo(**r._mapping) for r in session.execute(
+            select(TipoChapa.id, TipoChapa.nome, TipoChapa.comprimento, TipoChapa.largura,
+                   TipoChapa.espessura, TipoChapa.preco)
+            .where(TipoChapa.id.in_({p['tipo_chapa_id'] for p in pecas_data}))
+        )}
+        fitas_map = {r.id: TipoFitaInfo(**r._mapping) for r in session.execute(
+            select(TipoFita.id, TipoFita.nome, TipoFita.comprimento_rolo, TipoFita.preco_rolo)
+            .where(TipoFita.id.in_({p['tipo_fita_id'] for p in pecas_data if p['tipo_fita_id']}))
+        )}
+    
+    # Mesmas peças, chapas e parâmetros -> resultado direto do cache
+    otimizados = _otimizar(
+        tuple(tuple(p[campo] for campo in CAMPOS_PECA) for p in pecas_data),
+        tuple(sorted((c.id, c.comprimento, c.largura, c.espessura) for c in chapas_map.values())),
+        kerf,
+        sentido_veio
     )
-    custo_total_projeto = custo_total_chapas + custo_total_fitas
-    
-    # Métricas gerais
-    col1, col2, col3, col4 = st.columns(4)
-    
-    with col1:
-        st.metric("Total de Chapas", total_chapas_geral)
-    
-    with col2:
-        st.metric("Custo Chapas", f"R$ {custo_total_chapas:.2f}")
     
-    with col3:
-        st.metric("Custo Fitas", f"R$ {custo_total_fitas:.2f}")
+    resultados = {}
     
-    with col4:
-        st.metric("CUSTO TOTAL", f"R$ {custo_total_projeto:.2f}")
+    for tipo_chapa_id, otimizado in otimizados.items():
+        # Calcular custos de fita (rolos inteiros, arredondados para cima)
+        custos_fita_por_tipo = {}
+        
+        for tipo_fita_id, total_mm in otimizado['fita_mm'].items():
+            tipo_fita = fitas_map[tipo_fita_id]
+            rolos = math.ceil(total_mm / 1000 / tipo_fita.comprimento_rolo)
+            custos_fita_por_tipo[tipo_fita_id] = {
+                'tipo_fita': tipo_fita,
+                'total_metros': total_mm / 1000,
+                'rolos': rolos,
+                'custo': rolos * tipo_fita.preco_rolo
+            }
+        
+        resultados[tipo_chapa_id] = {
+            'tipo_chapa': chapas_map[tipo_chapa_id],
+            'chapas': otimizado['chapas'],
+            'custos_fita': custos_fita_por_tipo
+        }
     
-    st.divider()
+    return resultados
+
+
+def resumir_resultados(resultados):
+    """Totais do projeto e por tipo de chapa, calculados uma vez por otimização"""
+    por_tipo = {}
+    for tipo_chapa_id, r in resultados.items():
+        chapas = r['chapas']
+        custo_chapas = len(chapas) * r['tipo_chapa'].preco
+        custo_fitas = sum(cf['custo'] for cf in r['custos_fita'].values())
+        por_tipo[tipo_chapa_id] = {
+            'n_chapas': len(chapas),
+            'custo_chapas': custo_chapas,
+            'custo_fitas': custo_fitas,
+            'custo': custo_chapas + custo_fitas,
+            'aprov_medio': sum(c.calcular_utilizacao() for c in chapas) / len(chapas) if chapas else 0
+        }
     
-    # Exibir cada tipo de material
-    for tipo_chapa_id, resultado in resultados.items():
-        tipo_chapa = resultado['tipo_chapa']
-        chapas = resultado['chapas']
-        custos_fita = resultado['custos_fita']
-        
-        custo_chapas_tipo = len(chapas) * tipo_chapa.preco
-        custo_fitas_tipo = sum(cf['custo'] for cf in custos_fita.values())
-        custo_total_tipo = custo_chapas_tipo + custo_fitas_tipo
+    custo_chapas = sum(t['custo_chapas'] for t in por_tipo.values())
+    custo_fitas = sum(t['custo_fitas'] for t in por_tipo.values())
+    return {
+        'total_chapas': sum(t['n_chapas'] for t in por_tipo.values()),
+        'custo_chapas': custo_chapas,
+        'custo_fitas': custo_fitas,
+        'custo_total': custo_chapas + custo_fitas,
+        'por_tipo': por_tipo
+    }
+
+
+def _assinatura_chapa(tipo_chapa_id, chapa):
+    """Assinatura do layout da chapa, separada por tipo de chapa"""
+    return (tipo_chapa_id,) + chapa.assinatura()
+
+
+def _diagrama_tela(tipo_chapa_id, chapa) -> bytes:
+    """PNG exibido na tela (em cache pela assinatura do layout)"""
+    return engine.render_chapa_png(_assinatura_chapa(tipo_chapa_id, chapa), chapa)
+
+
+@st.fragment
+def _render_tipo(tipo_chapa_id, resultado, resumo_tipo):
+    """Resultado de um tipo de chapa (custos, fitas e diagramas) como fragmento"""
+    tipo_chapa = resultado['tipo_chapa']
+    chapas = resultado['chapas']
+    custos_fita = resultado['custos_fita']
+    
+    custo_chapas_tipo = resumo_tipo['custo_chapas']
+    custo_total_tipo = resumo_tipo['custo']
+    aproveitamento_medio = resumo_tipo['aprov_medio']
+    
+    with st.expander(
+        f"📦 {tipo_chapa.nome} - {len(chapas)} chapa(s) - Custo: R$ {custo_total_tipo:.2f}",
+        expanded=True
+    ):
+        # Informações do tipo
+        col_info1, col_info2, col_info3 = st.columns(3)
+        
+        with col_info1:
+            st.markdown(f"**Dimensão:** {int(tipo_chapa.comprimento)}×{int(tipo_chapa.largura)}×{int(tipo_chapa.espessura)}mm")
+            st.markdown(f"**Preço/chapa:** R$ {tipo_chapa.preco:.2f}")
+        
+        with col_info2:
+            st.markdown(f"**Quantidade:** {len(chapas)} chapas")
+            st.markdown(f"**Custo chapas:** R$ {custo_chapas_tipo:.2f}")
+        
+        with col_info3:
+            st.markdown(f"**Aproveitamento:** {aproveitamento_medio:.1f}%")
+            st.markdown(f"**Desperdício:** {100 - aproveitamento_medio:.1f}%")
+        
+        # Fitas usadas
+        if custos_fita:
+            st.markdown("##### 📏 Fitas de Borda Utilizadas")
+            for fita_info in custos_fita.values():
+                tipo_fita = fita_info['tipo_fita']
+                st.markdown(
+                    f"• **{tipo_fita.nome}**: {fita_info['total_metros']:.2f}m "
+                    f"({fita_info['rolos']} rolos) - R$ {fita_info['custo']:.2f}"
+                )
         
-        aproveitamento_medio = sum(c.calcular_utilizacao() for c in chapas) / len(chapas) if chapas else 0
+        st.divider()
         
-        with st.expander(
-            f"📦 {tipo_chapa.nome} - {len(chapas)} chapa(s) - Custo: R$ {custo_total_tipo:.2f}",
-            expanded=True
-        ):
-            # Informações do tipo
-            col_info1, col_info2, col_info3 = st.columns(3)
-            
-            with col_info1:
-                st.markdown(f"**Dimensão:** {int(tipo_chapa.comprimento)}×{int(tipo_chapa.largura)}×{int(tipo_chapa.espessura)}mm")
-                st.markdown(f"**Preço/chapa:** R$ {tipo_chapa.preco:.2f}")
+        # Diagramas das chapas
+        for chapa in chapas:
+            st.markdown(f"**Chapa {chapa.numero} - Aproveitamento: {chapa.calcular_utilizacao():.1f}%**")
             
-            with col_info2:
-                st.markdown(f"**Quantidade:** {len(chapas)} chapas")
-                st.markdown(f"**Custo chapas:** R$ {custo_chapas_tipo:.2f}")
-            
-            with col_info3:
-                st.markdown(f"**Aproveitamento:** {aproveitamento_medio:.1f}%")
-                st.markdown(f"**Desperdício:** {100 - aproveitamento_medio:.1f}%")
-            
-            # Fitas usadas
-            if custos_fita:
-                st.markdown("##### 📏 Fitas de Borda Utilizadas")
-                for fita_info in custos_fita.values():
-                    tipo_fita = fita_info['tipo_fita']
-                    st.markdown(
-                        f"• **{tipo_fita.nome}**: {fita_info['total_metros']:.2f}m "
-                        f"({fita_info['rolos']} rolos) - R$ {fita_info['custo']:.2f}"
-                    )
+            st.image(_diagrama_tela(tipo_chapa_id, chapa))
             
-            st.divider()
+            # Detalhes
+            total_pecas_chapa = sum(len(f.pecas) for f in chapa.faixas)
+            st.caption(f"🔹 {total_pecas_chapa} peças | 🔹 Desperdício: {chapa.calcular_desperdicio():.1f}%")
             
-            # Diagramas das chapas
-            for chapa in chapas:
-                st.markdown(f"**Chapa {chapa.numero} - Aproveitamento: {chapa.calcular_utilizacao():.1f}%**")
-                
-                gerador = engine.GeradorDiagrama(chapa)
-                fig = gerador.gerar_diagrama(dpi=100)
-                st.pyplot(fig)
-                plt.close(fig)
-                
-                # Detalhes
-                total_pecas_chapa = sum(len(f.pecas) for f in chapa.faixas)
-                st.caption(f"🔹 {total_pecas_chapa} peças | 🔹 Desperdício: {chapa.calcular_desperdicio():.1f}%")
-                
-                st.markdown("---")
-    
-    # ====================================================================
-    # RESUMO FINAL E PDF
-    # ====================================================================
-    
-    st.header("💰 Resumo Final do Projeto")
-    
-    # Resumo por tipo de material
-    for tipo_chapa_id, resultado in resultados.items():
-        tipo_chapa = resultado['tipo_chapa']
-        chapas = resultado['chapas']
-        custos_fita = resultado['custos_fita']
-        
-        custo_chapas = len(chapas) * tipo_chapa.preco
-        custo_fitas = sum(cf['custo'] for cf in custos_fita.values())
-        
-        st.markdown(f"**{tipo_chapa.nome}:**")
-        st.markdown(f"• {len(chapas)} chapas × R$ {tipo_chapa.preco:.2f} = R$ {custo_chapas:.2f}")
-        
-        if custos_fita:
-            for fita_info in custos_fita.values():
-                st.markdown(f"• Fita {fita_info['tipo_fita'].nome}: R$ {fita_info['custo']:.2f}")
-    
-    st.success(f"""
-    📊 **RESUMO GERAL:**
-    • {total_chapas_geral} chapas de MDF
-    • Custo total de materiais: **R$ {custo_total_projeto:.2f}**
-    """)
-    
-    # Botões de ação
-    st.divider()
-    
+            st.markdown("---")
+
+
+@st.fragment
+def _acoes_resultado(resultados, custo_total_projeto):
+    """PDF, etiquetas e salvar; os cliques reexecutam só estes botões, não os diagramas"""
     col_pdf1, col_pdf2, col_pdf3 = st.columns(3)
     
     with col_pdf1:
@@ -1510,6 +1421,71 @@ def exibir_resultados_otimizacao():
                 resultados,
                 custo_total_projeto
             )
+
+
+def exibir_resultados_otimizacao():
+    """Exibe os resultados da otimização"""
+    st.header("📊 Resultados da Otimização")
+    
+    resultados = st.session_state.resultados_otimizacao
+    
+    # Totais gerais, calculados junto com a otimização
+    resumo = st.session_state.get('resumo') or resumir_resultados(resultados)
+    total_chapas_geral = resumo['total_chapas']
+    custo_total_chapas = resumo['custo_chapas']
+    custo_total_fitas = resumo['custo_fitas']
+    custo_total_projeto = resumo['custo_total']
+    
+    # Métricas gerais
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.metric("Total de Chapas", total_chapas_geral)
+    
+    with col2:
+        st.metric("Custo Chapas", f"R$ {custo_total_chapas:.2f}")
+    
+    with col3:
+        st.metric("Custo Fitas", f"R$ {custo_total_fitas:.2f}")
+    
+    with col4:
+        st.metric("CUSTO TOTAL", f"R$ {custo_total_projeto:.2f}")
+    
+    st.divider()
+    
+    # Exibir cada tipo de material
+    for tipo_chapa_id, resultado in resultados.items():
+        _render_tipo(tipo_chapa_id, resultado, resumo['por_tipo'][tipo_chapa_id])
+    
+    # ====================================================================
+    # RESUMO FINAL E PDF
+    # ====================================================================
+    
+    st.header("💰 Resumo Final do Projeto")
+    
+    # Resumo por tipo de material
+    for tipo_chapa_id, resultado in resultados.items():
+        tipo_chapa = resultado['tipo_chapa']
+        custos_fita = resultado['custos_fita']
+        resumo_tipo = resumo['por_tipo'][tipo_chapa_id]
+        
+        st.markdown(f"**{tipo_chapa.nome}:**")
+        st.markdown(f"• {resumo_tipo['n_chapas']} chapas × R$ {tipo_chapa.preco:.2f} = R$ {resumo_tipo['custo_chapas']:.2f}")
+        
+        if custos_fita:
+            for fita_info in custos_fita.values():
+                st.markdown(f"• Fita {fita_info['tipo_fita'].nome}: R$ {fita_info['custo']:.2f}")
+    
+    st.success(f"""
+    📊 **RESUMO GERAL:**
+    • {total_chapas_geral} chapas de MDF
+    • Custo total de materiais: **R$ {custo_total_projeto:.2f}**
+    """)
+    
+    # Botões de ação
+    st.divider()
+    
+    _acoes_resultado(resultados, custo_total_projeto)
     
     # Informação sobre documentos
     st.info("""
@@ -1546,25 +1522,11 @@ def salvar_projeto_completo(config_projeto, pecas_data, resultados, custo_total)
         session.add(novo_projeto)
         session.flush()  # Para obter o ID do projeto
         
-        # Salvar cada peça do projeto
-        for peca_data in pecas_data:
-            peca_projeto = PecaProjeto(
-                projeto_id=novo_projeto.id,
-                nome=peca_data['nome'],
-                comprimento=peca_data['comprimento'],
-                largura=peca_data['largura'],
-                quantidade=peca_data['quantidade'],
-                tipo_chapa_id=peca_data['tipo_chapa_id'],
-                tipo_fita_id=peca_data['tipo_fita_id'],
-                fita_borda_comp1=peca_data['fita_borda_comp1'],
-                fita_borda_comp2=peca_data['fita_borda_comp2'],
-                fita_borda_larg1=peca_data['fita_borda_larg1'],
-                fita_borda_larg2=peca_data['fita_borda_larg2'],
-                respeitar_veio=peca_data['respeitar_veio']
-            )
-            session.add(peca_projeto)
-        
-        session.commit()
+        # Peças do projeto num único executemany, na mesma transação do projeto
+        _insert_registros(session, PecaProjeto, [
+            {'projeto_id': novo_projeto.id, **{k: peca_data[k] for k in CAMPOS_PECA}}
+            for peca_data in pecas_data
+        ])
         
         st.success(f"✅ Projeto '{novo_projeto.nome}' salvo com sucesso!")
         st.info(f"💰 Valor Total: R$ {custo_total:.2f} (Chapas: R$ {custo_total_chapas:.2f} + Fitas: R$ {custo_total_fitas:.2f})")
@@ -1603,10 +1565,6 @@ def gerar_pdf_por_tipo(resultados, config_projeto):
     """Gera PDF separado por tipo de chapa com custos individuais e total"""
     from reportlab.lib.pagesizes import A4
     from reportlab.pdfgen import canvas as pdf_canvas
-    from reportlab.lib.utils import ImageReader
-    from PIL import Image
-    from io import BytesIO
-    import matplotlib.pyplot as plt
     
     buffer = BytesIO()
     pdf = pdf_canvas.Canvas(buffer, pagesize=A4)
@@ -1632,39 +1590,18 @@ def gerar_pdf_por_tipo(resultados, config_projeto):
         # ================================================================
         
         for chapa in chapas:
-            # Gerar diagrama
-            gerador = engine.GeradorDiagrama(chapa)
-            fig = gerador.gerar_diagrama(dpi=150)
-            
-            img_buffer = BytesIO()
-            fig.savefig(img_buffer, format='png', dpi=150, bbox_inches='tight')
-            img_buffer.seek(0)
-            
-            pil_image = Image.open(img_buffer)
-            img_reader = ImageReader(pil_image)
-            
             # Título da página
             pdf.setFont("Helvetica-Bold", 14)
             pdf.drawString(50, altura_pagina - 40, f"{tipo_chapa.nome} - Chapa {chapa.numero}")
             
-            # Dimensões da imagem
-            img_width, img_height = pil_image.size
-            scale = min(
-                (largura_pagina - 100) / img_width,
-                ((altura_pagina - 300) / img_height)
+            # Diagrama em vetor direto no canvas, no alto da página: sem
+            # rasterizar nem embutir imagem, nítido em qualquer zoom
+            base = engine.GeradorDiagrama(chapa).desenhar_diagrama_pdf(
+                pdf, 50, 220, largura_pagina - 100, altura_pagina - 300, topo=True
             )
             
-            nova_largura = img_width * scale
-            nova_altura = img_height * scale
-            
-            x_img = (largura_pagina - nova_largura) / 2
-            y_img = altura_pagina - 80 - nova_altura
-            
-            # Desenhar diagrama
-            pdf.drawImage(img_reader, x_img, y_img, width=nova_largura, height=nova_altura, preserveAspectRatio=True)
-            
             # Lista de peças desta chapa
-            y = y_img - 30
+            y = base - 30
             
             pdf.setFont("Helvetica-Bold", 11)
             pdf.drawString(50, y, "Peças desta chapa:")
@@ -1673,35 +1610,24 @@ def gerar_pdf_por_tipo(resultados, config_projeto):
             pdf.setFont("Helvetica", 9)
             
             # Coletar todas as peças
-            pecas_chapa = []
-            for faixa in chapa.faixas:
-                for peca_pos in faixa.pecas:
-                    pecas_chapa.append(peca_pos.peca)
+            pecas_chapa = [peca_pos.peca for faixa in chapa.faixas for peca_pos in faixa.pecas]
             
-            # Agrupar peças iguais
-            pecas_agrupadas = {}
+            # Agrupar peças iguais: contagem por (nome, comprimento, largura) e a
+            # primeira peça de cada chave para as bordas
+            qtd_por_chave = Counter((p.nome, p.comprimento, p.largura) for p in pecas_chapa)
+            primeira = {}
             for peca in pecas_chapa:
-                chave = f"{peca.nome}_{peca.comprimento}_{peca.largura}"
-                if chave not in pecas_agrupadas:
-                    pecas_agrupadas[chave] = {'peca': peca, 'qtd': 0}
-                pecas_agrupadas[chave]['qtd'] += 1
+                primeira.setdefault((peca.nome, peca.comprimento, peca.largura), peca)
             
             # Listar peças
-            for info in pecas_agrupadas.values():
-                peca = info['peca']
-                qtd = info['qtd']
+            for chave, qtd in qtd_por_chave.items():
+                peca = primeira[chave]
                 
                 # Formatar fitas
-                bordas = []
-                if peca.fita_borda_comp1:
-                    bordas.append("▲")
-                if peca.fita_borda_comp2:
-                    bordas.append("▼")
-                if peca.fita_borda_larg1:
-                    bordas.append("◀")
-                if peca.fita_borda_larg2:
-                    bordas.append("▶")
-                fitas_str = " ".join(bordas) if bordas else "-"
+                fitas_str = engine.Peca.bordas_str(
+                    peca.fita_borda_comp1, peca.fita_borda_comp2,
+                    peca.fita_borda_larg1, peca.fita_borda_larg2
+                )
                 
                 texto = f"• {peca.nome} ({int(peca.comprimento)}×{int(peca.largura)}mm) - Qtd: {qtd}"
                 if fitas_str != "-":
@@ -1716,8 +1642,6 @@ def gerar_pdf_por_tipo(resultados, config_projeto):
             pdf.drawString(50, y, f"Aproveitamento: {chapa.calcular_utilizacao():.1f}% | Desperdício: {chapa.calcular_desperdicio():.1f}%")
             
             pdf.showPage()
-            plt.close(fig)
-            img_buffer.close()
         
         # ================================================================
         # RESUMO DE CUSTOS DESTE TIPO DE CHAPA
@@ -1872,10 +1796,17 @@ def gerar_pdf_por_tipo(resultados, config_projeto):
 
 def tela_projetos():
     """Tela de gerenciamento de projetos"""
+    # Uma sessão só para o rerun inteiro da tela, modal de exclusão incluído:
+    # o projeto a excluir já está no identity map, com as peças carregadas.
+    # Não fica em cache_resource porque Session não é thread-safe e seria
+    # compartilhada entre usuários; conexões já vêm do pool do SessionLocal.
+    with SessionLocal() as session:
+        _tela_projetos(session)
+
+
+def _tela_projetos(session):
     st.title("📁 Gerenciamento de Projetos")
     
-    session = db_manager.get_session()
-    
     # Filtro por cliente
     st.markdown("### 🔍 Filtrar Projetos")
     
@@ -1908,12 +1839,13 @@ def tela_projetos():
     
     st.markdown("---")
     
-    # Buscar projetos com filtro
+    # Buscar projetos com filtro; as peças de todos vêm num único SELECT ... IN
+    consulta = session.query(Projeto).options(selectinload(Projeto.pecas))
     if cliente_id_filtro:
-        projetos = session.query(Projeto).filter_by(cliente_id=cliente_id_filtro).order_by(Projeto.criado_em.desc()).all()
+        projetos = consulta.filter_by(cliente_id=cliente_id_filtro).order_by(Projeto.criado_em.desc()).all()
         st.subheader(f"Projetos de {cliente_filtro}: {len(projetos)}")
     else:
-        projetos = session.query(Projeto).order_by(Projeto.criado_em.desc()).all()
+        projetos = consulta.order_by(Projeto.criado_em.desc()).all()
         st.subheader(f"Total: {len(projetos)} projeto(s) salvo(s)")
     
     if not projetos:
@@ -1921,15 +1853,20 @@ def tela_projetos():
             st.info(f"📋 Nenhum projeto encontrado para o cliente {cliente_filtro}.")
         else:
             st.info("📋 Nenhum projeto salvo ainda. Crie um projeto no Otimizador e clique em '💾 Salvar Projeto'.")
-        session.close()
         return
     
+    # Clientes e tipos por id, para não consultar o banco dentro dos loops
+    # (inclui tipos inativos, que projetos antigos ainda referenciam)
+    clientes_map = {c.id: c for c in clientes}
+    tipos_chapa = {c.id: c for c in session.query(TipoChapa)}
+    tipos_fita = {f.id: f for f in session.query(TipoFita)}
+    
     # Listar projetos
     for projeto in projetos:
         # Buscar cliente se houver
         cliente_nome = "Sem cliente"
         if projeto.cliente_id:
-            cliente = session.query(Cliente).get(projeto.cliente_id)
+            cliente = clientes_map.get(projeto.cliente_id)
             if cliente:
                 cliente_nome = cliente.nome
         
@@ -1941,10 +1878,18 @@ def tela_projetos():
         valor_chapas = projeto.valor_chapas if projeto.valor_chapas else 0.0
         valor_fitas = projeto.valor_fitas if projeto.valor_fitas else 0.0
         
-        with st.expander(
+        # O expander guarda se está aberto (e reroda ao abrir/fechar): os
+        # detalhes e as tabelas só são montados para os projetos abertos
+        painel = st.expander(
             f"📂 {projeto.nome} - {cliente_nome} | 💰 R$ {valor_total:.2f} | {total_pecas} peças",
-            expanded=False
-        ):
+            expanded=False,
+            key=f"exp_proj_{projeto.id}",
+            on_change="rerun"
+        )
+        if not painel.open:
+            continue
+        
+        with painel:
             # Informações do projeto
             col_info1, col_info2 = st.columns(2)
             
@@ -1975,7 +1920,7 @@ def tela_projetos():
             
             # Exibir peças por grupo
             for chapa_id, pecas_grupo in pecas_por_chapa.items():
-                tipo_chapa = session.query(TipoChapa).get(chapa_id)
+                tipo_chapa = tipos_chapa.get(chapa_id)
                 if not tipo_chapa:
                     continue
                 
@@ -1987,21 +1932,15 @@ def tela_projetos():
                     # Buscar tipo de fita
                     tipo_fita_nome = "-"
                     if peca.tipo_fita_id:
-                        tipo_fita = session.query(TipoFita).get(peca.tipo_fita_id)
+                        tipo_fita = tipos_fita.get(peca.tipo_fita_id)
                         if tipo_fita:
                             tipo_fita_nome = tipo_fita.nome
                     
                     # Formatar bordas
-                    bordas = []
-                    if peca.fita_borda_comp1:
-                        bordas.append("▲")
-                    if peca.fita_borda_comp2:
-                        bordas.append("▼")
-                    if peca.fita_borda_larg1:
-                        bordas.append("◀")
-                    if peca.fita_borda_larg2:
-                        bordas.append("▶")
-                    fitas_str = " ".join(bordas) if bordas else "-"
+                    fitas_str = engine.Peca.bordas_str(
+                        peca.fita_borda_comp1, peca.fita_borda_comp2,
+                        peca.fita_borda_larg1, peca.fita_borda_larg2
+                    )
                     
                     dados_tabela.append({
                         'Nome': peca.nome,
@@ -2056,8 +1995,6 @@ def tela_projetos():
                     st.session_state.deleting_projeto_id = projeto.id
                     st.rerun()
     
-    session.close()
-    
     # Modal de exclusão
     if 'deleting_projeto_id' in st.session_state:
         modal_excluir_projeto()
@@ -2066,35 +2003,31 @@ def tela_projetos():
 @st.dialog("🗑️ Excluir Projeto")
 def modal_excluir_projeto():
     """Modal para confirmar exclusão de projeto"""
-    session = db_manager.get_session()
-    projeto = session.query(Projeto).get(st.session_state.deleting_projeto_id)
-    
-    if projeto:
-        st.warning(f"⚠️ Tem certeza que deseja excluir o projeto **{projeto.nome}**?")
-        st.write("Esta ação não pode ser desfeita. Todas as peças do projeto serão removidas.")
-        
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            if st.button("✅ Sim, excluir", key="confirm_del_proj", use_container_width=True, type="primary"):
-                # Excluir peças primeiro (cascade deveria fazer isso, mas por segurança)
-                for peca in projeto.pecas:
-                    session.delete(peca)
-                
-                session.delete(projeto)
-                session.commit()
-                session.close()
-                del st.session_state.deleting_projeto_id
-                st.success("✅ Projeto excluído com sucesso!")
-                st.rerun()
+    # Sessão própria: o diálogo também roda sozinho, depois que a da tela fechou
+    with SessionLocal() as session:
+        projeto = session.get(Projeto, st.session_state.deleting_projeto_id)
         
-        with col2:
-            if st.button("❌ Cancelar", key="cancel_del_proj", use_container_width=True):
-                session.close()
-                del st.session_state.deleting_projeto_id
-                st.rerun()
-    else:
-        session.close()
+        if projeto:
+            st.warning(f"⚠️ Tem certeza que deseja excluir o projeto **{projeto.nome}**?")
+            st.write("Esta ação não pode ser desfeita. Todas as peças do projeto serão removidas.")
+            
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                if st.button("✅ Sim, excluir", key="confirm_del_proj", use_container_width=True, type="primary"):
+                    # Um DELETE para as peças e outro para o projeto; session.delete
+                    # passaria pelo cascade, um DELETE por peça
+                    session.execute(delete(PecaProjeto).where(PecaProjeto.projeto_id == projeto.id))
+                    session.execute(delete(Projeto).where(Projeto.id == projeto.id))
+                    session.commit()
+                    del st.session_state.deleting_projeto_id
+                    st.success("✅ Projeto excluído com sucesso!")
+                    st.rerun()
+            
+            with col2:
+                if st.button("❌ Cancelar", key="cancel_del_proj", use_container_width=True):
+                    del st.session_state.deleting_projeto_id
+                    st.rerun()
 
 # ============================================================================
 # APLICAÇÃO PRINCIPAL